@@ -15,8 +15,9 @@ import subprocess
 import sys
 import getopt
 import time
-import requests
 import json
+import logging
+import powerSwitch
 
 # check syntax and arguments
 if (len(sys.argv) < 1 or len(sys.argv) > 3):
@@ -48,13 +49,12 @@ class rmdConfig(object):
     _config = configparser.ConfigParser()
     _rootdir = os.path.dirname(os.path.abspath('config.ini'))
     _config.read(_rootdir + "//config/config.ini")
-    _gpio_usage = _config.get("GPIO", "GPIO_USAGE")
     _adb_path = _config.get("ENVIROMENT", "ADB_PATH", fallback='/usr/bin')
     _adb_port = _config.get("ENVIROMENT", "ADB_PORT", fallback='5555')
     _try_adb_first = _config.get("REBOOTOPTIONS", "TRY_ADB_FIRST", fallback='False')
-    _off_on_sleep = _config.get("REBOOTOPTIONS", "OFF_ON_SLEEP", fallback=5)
 
     def __init__(self):
+        powerSwitch.configure(self._config)
         self.initRMDdata()
 
     def initRMDdata(self):
@@ -73,6 +73,9 @@ class rmdConfig(object):
                                       'switch_mode': _jsondata[device]["SWITCH_MODE"],
                                       'switch_option': _jsondata[device]["SWITCH_OPTION"],
                                       'switch_value': _jsondata[device]["SWITCH_VALUE"],
+                                      'power_switch': powerSwitch.create_driver(_jsondata[device]["SWITCH_MODE"],
+                                                                                _jsondata[device]["SWITCH_OPTION"],
+                                                                                _jsondata[device]["SWITCH_VALUE"]),
                                       'led_position': _jsondata[device]["LED_POSITION"]}
 
     def doRebootDevice(self, DEVICE_ORIGIN_TO_REBOOT):
@@ -134,139 +137,23 @@ class rmdConfig(object):
             return 1
 
     def reboot_device_via_power(self, DEVICE_ORIGIN_TO_REBOOT):
-        ## read powerSwitch config
-        powerSwitchMode = self._rmd_data[DEVICE_ORIGIN_TO_REBOOT]['switch_mode']
-        powerSwitchOption = self._rmd_data[DEVICE_ORIGIN_TO_REBOOT]['switch_option']
-        powerSwitchValue = self._rmd_data[DEVICE_ORIGIN_TO_REBOOT]['switch_value']
-
-        ## HTML
-        if powerSwitchMode == 'HTML':
-            print("PowerSwitch with HTML starting.")
-            poweron = powerSwitchValue.split(";")[0]
-            poweroff = powerSwitchValue.split(";")[1]
-            print("turn HTTP PowerSwitch off")
-            requests.get(poweroff)
-            time.sleep(int(self._off_on_sleep))
-            print("turn HTTP PowerSwitch on")
-            requests.get(poweron)
-            print("PowerSwitch with HTML done.")
-            return
-
-            ## GPIO
-        elif powerSwitchMode == 'GPIO':
-            print("PowerSwitch with GPIO starting.")
-            relay_mode = powerSwitchOption.split(";")[0]
-            cleanup_mode = powerSwitchOption.split(";")[1]
-            gpionr = int(powerSwitchValue)
-            print("turn GPIO PowerSwitch off")
-            GPIO.setwarnings(False)
-            GPIO.setmode(GPIO.BCM)
-
-            try:
-                eval(cleanup_mode)
-            except:
-                cleanup_mode = "False"
-
-            if eval(cleanup_mode):
-                GPIO.cleanup()
-                print("GPIO cleanup done!")
-
-            if relay_mode == 'NO':
-                print("Relay_mode: " + relay_mode)
-                # GPIO.setup(gpionr, GPIO.OUT, initial=GPIO.HIGH)
-                print("setting GPIO setup to: GPIO.OUT")
-                GPIO.setup(gpionr, GPIO.OUT)
-                print("setting GPIO output to: GPIO.HIGH")
-                GPIO.output(gpionr, GPIO.HIGH)
-            elif relay_mode == 'NC':
-                print("Relay_mode: " + relay_mode)
-                # GPIO.setup(gpionr, GPIO.OUT, initial=GPIO.LOW)
-                print("setting GPIO setup to: GPIO.OUT")
-                GPIO.setup(gpionr, GPIO.OUT)
-                print("setting GPIO output to: GPIO.LOW")
-                GPIO.output(gpionr, GPIO.LOW)
-            else:
-                print("wrong relay_mode in config")
-            print("sleeping 10s")
-            time.sleep(int(self._off_on_sleep))
-            print("turn GPIO PowerSwitch on")
-            if relay_mode == 'NO':
-                print("Relay_mode: " + relay_mode)
-                # GPIO.output(gpionr, GPIO.LOW)
-                print("setting GPIO setup to: GPIO.OUT")
-                GPIO.setup(gpionr, GPIO.OUT)
-                print("setting GPIO output to: GPIO.LOW")
-                GPIO.output(gpionr, GPIO.LOW)
-            elif relay_mode == 'NC':
-                print("Relay_mode: " + relay_mode)
-                # GPIO.output(gpionr, GPIO.HIGH)
-                print("setting GPIO setup to: GPIO.OUT")
-                GPIO.setup(gpionr, GPIO.OUT)
-                print("setting GPIO output to: GPIO.HIGH")
-                GPIO.output(gpionr, GPIO.HIGH)
-            else:
-                print("wrong relay_mode in config")
-
-            if eval(cleanup_mode):
-                GPIO.cleanup()
-                print("GPIO cleanup done!")
-            print("PowerSwitch with GPIO done.")
-            return
-
-        ## CMD
-        elif powerSwitchMode == 'CMD':
-            print("PowerSwitch with CMD starting.")
-            try:
-                subprocess.check_output(powerSwitchValue, shell=True)
-            except subprocess.CalledProcessError:
-                print("failed to fire command")
-            time.sleep(int(self._off_on_sleep))
-            print("PowerSwitch with CMD done.")
-            self._rmd_data[DEVICE_ORIGIN_TO_REBOOT]['reboot_forced'] = True
-            self._rmd_data[DEVICE_ORIGIN_TO_REBOOT]['reboot_type'] = "CMD"
-            return
-
-        ## SCRIPT
-        elif powerSwitchMode == 'SCRIPT':
-            print("PowerSwitch with SCRIPT starting.")
-            poweron = powerSwitchValue.split(";")[0]
-            poweroff = powerSwitchValue.split(";")[1]
-            print("execute script for PowerSwitch off")
-            try:
-                subprocess.check_output(poweroff, shell=True)
-            except subprocess.CalledProcessError:
-                print("failed to start script")
-            time.sleep(int(self._off_on_sleep))
-            print("execute script for PowerSwitch on")
-            try:
-                subprocess.check_output(poweron, shell=True)
-            except subprocess.CalledProcessError:
-                print("failed to start script")
-            print("PowerSwitch with SCRIPT done.")
-            return
-
-        ## POE
-        elif powerSwitchMode == 'POE':
-            print("PowerSwitch with POE starting.")
-            try:
-                subprocess.check_output(powerSwitchValue, shell=True)
-            except subprocess.CalledProcessError:
-                print("failed to fire poe port reset")
-            time.sleep(int(self._off_on_sleep))
-            print("PowerSwitch with POE done.")
+        driver = self._rmd_data[DEVICE_ORIGIN_TO_REBOOT]['power_switch']
+        if driver is None:
+            print("no PowerSwitch configured. Do it manually!!!")
             return
 
-        else:
-            print("no PowerSwitch configured. Do it manually!!!")
+        print("PowerSwitch with {} starting.".format(driver.mode))
+        result = driver.reboot()
+        if result == powerSwitch.REBOOT_PORT_DISABLED:
+            print("Port of Device {} was disabled after a PoE overload.".format(DEVICE_ORIGIN_TO_REBOOT))
+        print("PowerSwitch with {} done.".format(driver.mode))
 
 
 if __name__ == '__main__':
+    # messages of the power switch drivers
+    logging.basicConfig(format='%(message)s', level=logging.INFO)
+
     ## init rmdConfig
     rmdConfig = rmdConfig()
 
-    # GPIO import libs
-    if eval(rmdConfig._gpio_usage):
-        print("import GPIO libs")
-        import RPi.GPIO as GPIO
-
     rmdConfig.doRebootDevice(main())
\ No newline at end of file
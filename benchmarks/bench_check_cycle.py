@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+#
+# Time of the device checks of one cycle (check_devices without the api request)
+# usage: benchmarks/bench_check_cycle.py [DEVICE_COUNT ...]
+#
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests'))
+from rmd_env import load_rmd
+from fake_rotom import make_status_data
+
+ROUNDS = 20
+
+
+def main():
+    rmd = load_rmd()
+    rmd._proto_timeout = 300
+
+    print("{:>8} {:>10}".format('devices', 'ms/cycle'))
+    for device_count in [int(arg) for arg in sys.argv[1:]] or [1000, 10000]:
+        status_data = make_status_data(device_count, rmd.makeTimestamp())
+        rmd._rmd_data = {device['origin']: rmd.DeviceState({"IP_ADDRESS": "10.0.0.1", "MAPPER_MODE": "ATLAS",
+                                                            "SWITCH_MODE": "CMD", "SWITCH_OPTION": "",
+                                                            "SWITCH_VALUE": "true"})
+                         for device in status_data['devices']}
+        rmd.getDeviceStatusData = lambda: status_data
+        rmd._device_status_cache['index'] = None
+
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            rmd.check_devices(rmd.CycleContext())
+        print("{:>8} {:>10.2f}".format(device_count, (time.perf_counter() - start) / ROUNDS * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+#
+# Time of the age calculations of one cycle with a clock read per calculation (before the CycleContext)
+# and with one clock snapshot per cycle
+# usage: benchmarks/bench_cycle_clock.py [DEVICE_COUNT ...]
+#
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests'))
+from rmd_env import load_rmd
+
+ROUNDS = 200
+
+
+def calc_past_sec_per_call(rmd, timestamp):
+    # calc_past_sec_from_now() before the CycleContext, reads the clock twice
+    if not timestamp:
+        return 99999
+    elif int(timestamp) > rmd.convert_to_milliseconds(int(time.time())):
+        return 0
+    return rmd.convert_to_seconds(rmd.convert_to_milliseconds(int(time.time()))) - rmd.convert_to_seconds(
+        int(timestamp))
+
+
+def cycle_per_call(rmd, devices):
+    for data in devices:
+        # offline time, reboot wait and reboot age like check_device() and check_rebooted_devices()
+        data.offline_sec = calc_past_sec_per_call(rmd, data.last_seen)
+        calc_past_sec_per_call(rmd, data.last_reboot_time)
+        calc_past_sec_per_call(rmd, data.last_reboot_time)
+
+
+def cycle_snapshot(rmd, devices):
+    cycle = rmd.CycleContext()
+    for data in devices:
+        data.offline_sec = rmd.calc_past_sec_from_now(data.last_seen, cycle.now)
+        rmd.calc_past_sec_from_now(data.last_reboot_time, cycle.now)
+        rmd.calc_past_sec_from_now(data.last_reboot_time, cycle.now)
+
+
+def main():
+    rmd = load_rmd()
+    now = rmd.makeTimestamp()
+
+    print("{:>8} {:>10} {:>10}".format('devices', 'variant', 'ms/cycle'))
+    for device_count in [int(arg) for arg in sys.argv[1:]] or [1000]:
+        devices = []
+        for index in range(device_count):
+            data = rmd.DeviceState({"IP_ADDRESS": "10.0.0.1", "MAPPER_MODE": "ATLAS", "SWITCH_MODE": "CMD",
+                                    "SWITCH_OPTION": "", "SWITCH_VALUE": "true"})
+            data.last_seen = now - index * 1000
+            data.last_reboot_time = now - index * 2000
+            devices.append(data)
+
+        for variant, cycle in (('per call', cycle_per_call), ('snapshot', cycle_snapshot)):
+            start = time.perf_counter()
+            for _ in range(ROUNDS):
+                cycle(rmd, devices)
+            print("{:>8} {:>10} {:>10.3f}".format(device_count, variant,
+                                                  (time.perf_counter() - start) / ROUNDS * 1000))
+
+
+if __name__ == '__main__':
+    main()
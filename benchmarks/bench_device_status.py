@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+#
+# Transferred bytes and CPU time of a device status fetch with full answer (200) and not modified answer (304)
+# usage: benchmarks/bench_device_status.py [DEVICE_COUNT ...]
+#
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests'))
+from rmd_env import load_rmd
+from fake_rotom import FakeRotom, make_status_data
+
+ROUNDS = 20
+
+
+def fetch_rounds(rmd, rotom, conditional):
+    """ fetch the status data ROUNDS times, returns body bytes and cpu seconds per fetch """
+    rotom.requests.clear()
+    cpu_start = time.process_time()
+    for _ in range(ROUNDS):
+        if not conditional:
+            rmd._device_status_cache.update({'etag': None, 'last_modified': None, 'data': None, 'index': None})
+        rmd.getDeviceStatusData()
+    cpu_time = (time.process_time() - cpu_start) / ROUNDS
+    return sum(request['body_bytes'] for request in rotom.requests) / ROUNDS, cpu_time
+
+
+def main():
+    rmd = load_rmd()
+    rmd._api_stream_parse = False
+    rmd._api_session = rmd.init_api_session()
+
+    print("{:>8} {:>6} {:>12} {:>10}".format('devices', 'answer', 'body bytes', 'cpu ms'))
+    for device_count in [int(arg) for arg in sys.argv[1:]] or [1000, 10000]:
+        rotom = FakeRotom(make_status_data(device_count))
+        rmd._api_endpoint_status = rotom.url
+
+        body_bytes, cpu_time = fetch_rounds(rmd, rotom, conditional=False)
+        print("{:>8} {:>6} {:>12.0f} {:>10.2f}".format(device_count, 200, body_bytes, cpu_time * 1000))
+
+        # first fetch fills the cache, all following fetches are answered with 304
+        rmd.getDeviceStatusData()
+        body_bytes, cpu_time = fetch_rounds(rmd, rotom, conditional=True)
+        print("{:>8} {:>6} {:>12.0f} {:>10.2f}".format(device_count, 304, body_bytes, cpu_time * 1000))
+        rotom.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+#
+# Time and peak memory of the full json parse and the ijson stream parse of the device status data
+# usage: benchmarks/bench_stream_parse.py [DEVICE_COUNT ...]
+#
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests'))
+from rmd_env import load_rmd
+from fake_rotom import FakeRotom, make_status_data
+
+import ijson
+
+ROUNDS = 10
+
+
+def fetch_uncached(rmd):
+    rmd._device_status_cache.update({'etag': None, 'last_modified': None, 'data': None, 'index': None})
+    return rmd.getDeviceStatusData()
+
+
+def measure(rmd, stream_parse):
+    """ wall and cpu seconds per fetch and the peak of python memory during one fetch """
+    rmd._api_stream_parse = stream_parse
+    fetch_uncached(rmd)
+
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    for _ in range(ROUNDS):
+        fetch_uncached(rmd)
+    wall_time = (time.perf_counter() - wall_start) / ROUNDS
+    cpu_time = (time.process_time() - cpu_start) / ROUNDS
+
+    rmd._device_status_cache['data'] = None
+    tracemalloc.start()
+    data = fetch_uncached(rmd)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return wall_time, cpu_time, peak, len(data['devices'])
+
+
+def main():
+    rmd = load_rmd()
+    rmd.ijson = ijson
+    rmd._api_session = rmd.init_api_session()
+
+    print("{:>8} {:>7} {:>10} {:>10} {:>12}".format('devices', 'parser', 'wall ms', 'cpu ms', 'peak KiB'))
+    for device_count in [int(arg) for arg in sys.argv[1:]] or [1000, 10000]:
+        rotom = FakeRotom(make_status_data(device_count))
+        rmd._api_endpoint_status = rotom.url
+        for parser, stream_parse in (('json', False), ('ijson', True)):
+            wall_time, cpu_time, peak, devices = measure(rmd, stream_parse)
+            assert devices == device_count
+            print("{:>8} {:>7} {:>10.2f} {:>10.2f} {:>12.0f}".format(device_count, parser, wall_time * 1000,
+                                                                    cpu_time * 1000, peak / 1024))
+        rotom.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,680 @@
+#
+# RebootMadDevices - PowerSwitch
+# Drivers to power cycle ATV devices, used by rebootMadDevice.py and ManualReboot.py
+#
+__author__ = "GhostTalker"
+__copyright__ = "Copyright 2023, The GhostTalker project"
+__version__ = "5.1.7"
+__status__ = "TEST"
+
+# generic/built-in and other libs
+import re
+import time
+import atexit
+import datetime
+import logging
+import subprocess
+import tempfile
+from threading import Lock
+from urllib.parse import urlparse
+import requests
+
+## result of a power cycle
+REBOOT_DONE = "DONE"
+REBOOT_PORT_DISABLED = "PORT_DISABLED"
+
+## settings from config.ini, set by configure()
+_settings = {}
+
+## registered drivers per SWITCH_MODE
+_drivers = {}
+
+## callback for driver timings: callback(switch_mode, operation, seconds)
+_timing_callback = None
+
+
+def configure(config):
+    """ read the power switch settings from config.ini """
+    global _switch_log_cache
+    _settings.update({
+        'off_on_sleep': int(config.get("REBOOTOPTIONS", "OFF_ON_SLEEP", fallback=5)),
+        'html_timeout': float(config.get("REBOOTOPTIONS", "HTML_TIMEOUT", fallback=10)),
+        'ssh_control_dir': config.get("ENVIROMENT", "SSH_CONTROL_DIR", fallback=tempfile.gettempdir()),
+        'ssh_control_persist': config.get("ENVIROMENT", "SSH_CONTROL_PERSIST", fallback=600),
+        'ssh_timeout': float(config.get("ENVIROMENT", "SSH_TIMEOUT", fallback=30)),
+        'switch_log_cache_ttl': float(config.get("ENVIROMENT", "SWITCH_LOG_CACHE_TTL", fallback=10)),
+        'snmp_version': config.get("SNMP", "SNMP_VERSION", fallback='2c'),
+        'snmp_outlet_oid': config.get("SNMP", "SNMP_OUTLET_OID", fallback='.1.3.6.1.4.1.318.1.1.4.4.2.1.3'),
+        'snmp_outlet_on': config.get("SNMP", "SNMP_OUTLET_ON", fallback=1),
+        'snmp_outlet_off': config.get("SNMP", "SNMP_OUTLET_OFF", fallback=2),
+        'snmp_timeout': float(config.get("SNMP", "SNMP_TIMEOUT", fallback=10)),
+        'pb_baudrate': int(config.get("POWERBOARD", "PB_BAUDRATE", fallback=9600)),
+        'gpio_usage': config.getboolean("GPIO", "GPIO_USAGE", fallback=False),
+        'gpio_backend': config.get("GPIO", "GPIO_BACKEND", fallback='RPI').upper(),
+    })
+    _switch_log_cache = SwitchLogCache(_settings['switch_log_cache_ttl'])
+
+    # GPIO import libs, the pins are only set up on the first power cycle
+    if _settings['gpio_usage']:
+        try:
+            get_gpio_controller()
+        except (ImportError, RuntimeError) as e:
+            logging.error("GPIO libs not usable: {}".format(e))
+
+
+def set_timing_callback(callback):
+    global _timing_callback
+    _timing_callback = callback
+
+
+def get_off_on_sleep():
+    """ seconds between power off and power on """
+    return _settings['off_on_sleep']
+
+
+def _timed(switch_mode, operation, function, *args):
+    start = time.monotonic()
+    try:
+        return function(*args)
+    finally:
+        if _timing_callback is not None:
+            _timing_callback(switch_mode, operation, time.monotonic() - start)
+
+
+def register_driver(switch_mode):
+    """ class decorator to register a driver for a SWITCH_MODE """
+    def register(driver_class):
+        driver_class.mode = switch_mode
+        _drivers[switch_mode] = driver_class
+        return driver_class
+    return register
+
+
+def create_driver(switch_mode, switch_option, switch_value):
+    """ driver with the parsed SWITCH_OPTION/SWITCH_VALUE of a device or None for unknown modes and bad values """
+    driver_class = _drivers.get(switch_mode)
+    if driver_class is None:
+        return None
+    try:
+        return driver_class(switch_option, switch_value)
+    except Exception as e:
+        # only this device is without power switch, like a failing power cycle before
+        logging.error("wrong SWITCH_OPTION '{}' or SWITCH_VALUE '{}' for SWITCH_MODE {}: {!r}".format(
+            switch_option, switch_value, switch_mode, e))
+        return None
+
+
+class PowerSwitchDriver(object):
+    """ base class of all drivers, the configuration of the device is parsed once in __init__ """
+    mode = None
+    # False for drivers which can only do the whole power cycle in one step
+    supports_split = True
+
+    def __init__(self, switch_option, switch_value):
+        self.switch_option = switch_option
+        self.switch_value = switch_value
+
+    @property
+    def target(self):
+        """ physical power target (switch host, gpio bank, html host, ...) shared by devices """
+        return "{}:{}".format(self.mode, self.switch_option.split(";")[0])
+
+    def power_off(self):
+        return _timed(self.mode, 'power_off', self._power_off)
+
+    def power_on(self):
+        return _timed(self.mode, 'power_on', self._power_on)
+
+    def reboot(self):
+        """ power cycle the device, returns REBOOT_DONE or REBOOT_PORT_DISABLED """
+        return _timed(self.mode, 'reboot', self._reboot)
+
+    def prepare(self):
+        """ checks before the power cycle, returns REBOOT_DONE or REBOOT_PORT_DISABLED """
+        return REBOOT_DONE
+
+    def _power_off(self):
+        raise NotImplementedError
+
+    def _power_on(self):
+        raise NotImplementedError
+
+    def _reboot(self):
+        if self.prepare() == REBOOT_PORT_DISABLED:
+            return REBOOT_PORT_DISABLED
+        self._power_off()
+        time.sleep(_settings['off_on_sleep'])
+        self._power_on()
+        return REBOOT_DONE
+
+    @classmethod
+    def power_batch(cls, drivers, power_on):
+        """ switch several devices of this driver at once, drivers can merge operations on the same target """
+        for driver in drivers:
+            # a failing device must not keep the other devices of the batch off
+            try:
+                if power_on:
+                    driver._power_on()
+                else:
+                    driver._power_off()
+            except Exception as e:
+                logging.error("failed to turn {} PowerSwitch {} {}: {!r}".format(
+                    driver.mode, driver.switch_option, "on" if power_on else "off", e))
+
+
+def _prepare(driver):
+    try:
+        return driver.prepare()
+    except Exception as e:
+        logging.error("failed to prepare {} PowerSwitch {}: {!r}".format(driver.mode, driver.switch_option, e))
+        return REBOOT_DONE
+
+
+def power_off_batch(drivers):
+    """ prepare and switch off devices of split drivers, returns the drivers which have to be switched on again.
+    Drivers whose power off failed are included, they may be switched off anyway and switching on is harmless """
+    prepared = [driver for driver in drivers if _prepare(driver) != REBOOT_PORT_DISABLED]
+    _power_batch(prepared, False)
+    return prepared
+
+
+def power_on_batch(drivers):
+    """ switch on devices of split drivers """
+    _power_batch(drivers, True)
+
+
+def _power_batch(drivers, power_on):
+    driver_classes = {}
+    for driver in drivers:
+        driver_classes.setdefault(type(driver), []).append(driver)
+    for driver_class, class_drivers in driver_classes.items():
+        try:
+            _timed(driver_class.mode, 'power_on_batch' if power_on else 'power_off_batch',
+                   driver_class.power_batch, class_drivers, power_on)
+        except Exception as e:
+            logging.error("failed to turn {} PowerSwitch {}: {!r}".format(
+                driver_class.mode, "on" if power_on else "off", e))
+
+
+## HTML
+@register_driver('HTML')
+class HtmlDriver(PowerSwitchDriver):
+
+    def __init__(self, switch_option, switch_value):
+        super(HtmlDriver, self).__init__(switch_option, switch_value)
+        self.poweron_url = switch_value.split(";")[0]
+        self.poweroff_url = switch_value.split(";")[1]
+
+    @property
+    def target(self):
+        return "HTML:{}".format(urlparse(self.poweron_url).netloc)
+
+    @staticmethod
+    def _request(url):
+        try:
+            requests.get(url, timeout=_settings['html_timeout']).raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logging.error("failed to call HTTP PowerSwitch: {}".format(e))
+
+    def _power_off(self):
+        logging.info("turn HTTP PowerSwitch off")
+        self._request(self.poweroff_url)
+
+    def _power_on(self):
+        logging.info("turn HTTP PowerSwitch on")
+        self._request(self.poweron_url)
+
+
+## GPIO
+class MockGPIO(object):
+    """ stand-in for RPi.GPIO to run the GPIO switch mode without a Raspberry Pi """
+    BCM = 11
+    OUT = 0
+    LOW = 0
+    HIGH = 1
+
+    def __init__(self):
+        self.pins = {}
+
+    def setwarnings(self, flag):
+        pass
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, channels, direction, initial=None):
+        for channel in channels if isinstance(channels, (list, tuple)) else [channels]:
+            if initial is not None:
+                self.pins[channel] = initial
+            else:
+                self.pins.setdefault(channel, self.LOW)
+
+    def output(self, channels, values):
+        if not isinstance(channels, (list, tuple)):
+            channels, values = [channels], [values]
+        for channel, value in zip(channels, values):
+            self.pins[channel] = value
+            logging.debug("Mock GPIO {} set to {}".format(channel, "HIGH" if value == self.HIGH else "LOW"))
+
+    def cleanup(self):
+        self.pins.clear()
+
+
+class GpioController(object):
+    """ owns the GPIO lib, every relay pin is set up once and all outputs are serialized """
+
+    def __init__(self, gpio):
+        self._gpio = gpio
+        self._lock = Lock()
+        self._pins = set()
+        self._cleanup = False
+        with self._lock:
+            self._gpio.setwarnings(False)
+            self._gpio.setmode(self._gpio.BCM)
+
+    def setup_pin(self, gpionr, initial, cleanup=False):
+        """ set up the pin as output once, initial is the level (True for HIGH) the pin keeps until it is switched """
+        with self._lock:
+            if gpionr not in self._pins:
+                logging.debug("setting GPIO {} setup to: GPIO.OUT, initial {}".format(
+                    gpionr, "GPIO.HIGH" if initial else "GPIO.LOW"))
+                self._gpio.setup(gpionr, self._gpio.OUT, initial=self._gpio.HIGH if initial else self._gpio.LOW)
+                self._pins.add(gpionr)
+            if cleanup and not self._cleanup:
+                # pins stay set up while RMD is running, cleanup is done once at exit
+                self._cleanup = True
+                atexit.register(self.cleanup)
+
+    def output(self, levels):
+        """ set several pins at once, levels maps gpio number to True (HIGH) or False (LOW) """
+        if not levels:
+            return
+        gpionrs = list(levels)
+        values = [self._gpio.HIGH if levels[gpionr] else self._gpio.LOW for gpionr in gpionrs]
+        with self._lock:
+            logging.debug("setting GPIO output {}".format(", ".join(
+                "{}: {}".format(gpionr, "GPIO.HIGH" if levels[gpionr] else "GPIO.LOW") for gpionr in gpionrs)))
+            self._gpio.output(gpionrs, values)
+
+    def cleanup(self):
+        with self._lock:
+            self._gpio.cleanup()
+            self._pins.clear()
+        logging.info("GPIO cleanup done!")
+
+
+_gpio_controller = None
+_gpio_controller_lock = Lock()
+
+
+def get_gpio_controller():
+    """ shared GPIO controller, created with the GPIO_BACKEND on first use """
+    global _gpio_controller
+    with _gpio_controller_lock:
+        if _gpio_controller is None:
+            if _settings['gpio_backend'] == 'MOCK':
+                logging.info("using mock GPIO backend")
+                gpio = MockGPIO()
+            else:
+                logging.debug("import GPIO libs")
+                import RPi.GPIO as gpio
+            _gpio_controller = GpioController(gpio)
+        return _gpio_controller
+
+
+@register_driver('GPIO')
+class GpioDriver(PowerSwitchDriver):
+
+    def __init__(self, switch_option, switch_value):
+        super(GpioDriver, self).__init__(switch_option, switch_value)
+        self.relay_mode = switch_option.split(";")[0]
+        self.cleanup_mode = switch_option.split(";")[1] == "True" if ";" in switch_option else False
+        self.gpionr = int(switch_value)
+        if self.relay_mode not in ('NO', 'NC'):
+            logging.error("wrong relay_mode in config for GPIO {}".format(self.gpionr))
+
+    @property
+    def target(self):
+        return "GPIO"
+
+    def level(self, power_on):
+        """ output level of the pin, NO relays are switched off with HIGH, NC relays with LOW """
+        return (self.relay_mode == 'NO') != power_on
+
+    def _power_off(self):
+        self.power_batch([self], False)
+
+    def _power_on(self):
+        self.power_batch([self], True)
+
+    @classmethod
+    def power_batch(cls, drivers, power_on):
+        # all relays of the Pi in one output call
+        drivers = [driver for driver in drivers if driver.relay_mode in ('NO', 'NC')]
+        levels = {driver.gpionr: driver.level(power_on) for driver in drivers}
+        if not _settings.get('gpio_usage'):
+            logging.error("GPIO_USAGE is not enabled, GPIO {} not switched".format(
+                ", ".join(str(gpionr) for gpionr in levels)))
+            return
+        try:
+            controller = get_gpio_controller()
+        except (ImportError, RuntimeError) as e:
+            logging.error("GPIO libs not usable: {}".format(e))
+            return
+
+        # pins are set up with the on level on first use, the relays are not switched before a power cycle
+        for driver in drivers:
+            controller.setup_pin(driver.gpionr, driver.level(True), driver.cleanup_mode)
+        logging.info("turn GPIO PowerSwitch {} {}".format(", ".join(str(gpionr) for gpionr in levels),
+                                                           "on" if power_on else "off"))
+        controller.output(levels)
+
+
+## CMD
+@register_driver('CMD')
+class CmdDriver(PowerSwitchDriver):
+    """ one command which does the whole power cycle """
+    supports_split = False
+
+    @property
+    def target(self):
+        return "CMD:{}".format(self.switch_value.split()[0] if self.switch_value else "")
+
+    def _reboot(self):
+        try:
+            subprocess.check_output(self.switch_value, shell=True)
+        except subprocess.CalledProcessError:
+            logging.error("failed to fire command")
+        return REBOOT_DONE
+
+
+## SCRIPT
+@register_driver('SCRIPT')
+class ScriptDriver(PowerSwitchDriver):
+
+    def __init__(self, switch_option, switch_value):
+        super(ScriptDriver, self).__init__(switch_option, switch_value)
+        self.poweron_script = switch_value.split(";")[0]
+        self.poweroff_script = switch_value.split(";")[1]
+
+    @property
+    def target(self):
+        return "SCRIPT:{}".format(self.switch_value.split()[0] if self.switch_value else "")
+
+    def _run(self, script):
+        try:
+            subprocess.check_output(script, shell=True)
+        except subprocess.CalledProcessError:
+            logging.error("failed to start script")
+
+    def _power_off(self):
+        logging.info("execute script for PowerSwitch off")
+        self._run(self.poweroff_script)
+
+    def _power_on(self):
+        logging.info("execute script for PowerSwitch on")
+        self._run(self.poweron_script)
+
+
+## POE
+@register_driver('POE')
+class PoeDriver(PowerSwitchDriver):
+    """ one command (usually ssh) which resets the poe port """
+    supports_split = False
+
+    @property
+    def target(self):
+        match = re.search(r'ssh\s+(?:-\S+\s+)*(\S+)', self.switch_value)
+        return "POE:{}".format(match.group(1).split("@")[-1] if match else self.switch_value.split()[0])
+
+    def _reboot(self):
+        try:
+            subprocess.check_output(self.switch_value, shell=True)
+        except subprocess.CalledProcessError:
+            logging.error("failed to fire poe port reset")
+        return REBOOT_DONE
+
+
+def ssh_switch_command(switch_login, command):
+    """ run a command on a switch, all commands for the same login share one persistent multiplexed ssh connection """
+    ssh_args = ['ssh',
+                '-o', 'BatchMode=yes',
+                '-o', 'ControlMaster=auto',
+                '-o', 'ControlPath={}/rmd-ssh-%C'.format(_settings['ssh_control_dir']),
+                '-o', 'ControlPersist={}'.format(_settings['ssh_control_persist']),
+                switch_login, command]
+    return subprocess.check_output(ssh_args, timeout=_settings['ssh_timeout'])
+
+
+class SwitchLogCache(object):
+    """ per switch cache of the latest log event of every port, only new log lines are read from the switch """
+
+    LOG_FILE = "/var/log/messages"
+
+    def __init__(self, ttl):
+        self._ttl = ttl
+        self._lock = Lock()
+        self._switches = {}
+
+    def _read_new_lines(self, switch_login, switch):
+        # print the end of the last complete line first and then only the lines after the last read offset,
+        # start over after log rotation. A line still being written (p bytes after the last newline) is read
+        # with the next call, otherwise its rest would be read without the timestamp.
+        offset = switch['offset']
+        command = "s=$(wc -c < {log}); o={offset}; [ $s -lt $o ] && o=0; " \
+                  "p=$(($({{ tail -c +$((o + 1)) {log} | head -c $((s - o)); echo; }} | tail -n 1 | wc -c) - 1)); " \
+                  "e=$((s - p)); echo $e; " \
+                  "tail -c +$((o + 1)) {log} | head -c $((e - o)) | grep Port".format(log=self.LOG_FILE, offset=offset)
+        try:
+            output = ssh_switch_command(switch_login, command)
+        except subprocess.CalledProcessError as e:
+            # grep has exit code 1 without new port lines
+            if e.returncode != 1:
+                raise
+            output = e.output
+
+        lines = output.decode("utf-8", errors="replace").split('\n')
+        switch['offset'] = int(lines[0])
+        return lines[1:]
+
+    def _index_lines(self, switch, lines):
+        default_year = str(datetime.datetime.now().year)
+        for line in lines:
+            if not line:
+                continue
+            match = re.match(r'(\S+\s+\d+\s\d+:\d+:\d+)\s(\S+)\s.*switch:\s(.+)', line)
+            if not match:
+                continue
+            date_time, host, message = match.groups()
+            dt_object = datetime.datetime.strptime(f'{date_time} {default_year}', '%b %d %H:%M:%S %Y')
+            log_entry = {'timestamp_ms': int(dt_object.timestamp() * 1000), 'host': host, 'message': message}
+            for port_id in set(re.findall(r'Port\s*:?\s*(\d+)', message)):
+                latest_entry = switch['ports'].get(port_id)
+                if latest_entry is None or latest_entry['timestamp_ms'] <= log_entry['timestamp_ms']:
+                    switch['ports'][port_id] = log_entry
+
+    def get_latest_port_event(self, switch_login, port_id):
+        """ newest log entry of the port, the switch log is read at most once per ttl for all ports """
+        with self._lock:
+            switch = self._switches.setdefault(switch_login, {'offset': 0, 'time': None, 'ports': {}, 'lock': Lock()})
+
+        with switch['lock']:
+            if switch['time'] is None or time.monotonic() - switch['time'] > self._ttl:
+                lines = self._read_new_lines(switch_login, switch)
+                self._index_lines(switch, lines)
+                switch['time'] = time.monotonic()
+                logging.debug("Read {} new port log lines from switch {}".format(len(lines), switch_login))
+            return switch['ports'].get(str(port_id))
+
+
+## POE PLUS (UNIFI)
+@register_driver('POEPLUS')
+class PoePlusDriver(PowerSwitchDriver):
+
+    def __init__(self, switch_option, switch_value):
+        super(PoePlusDriver, self).__init__(switch_option, switch_value)
+        self.port_id = switch_option
+        self.switch_login = switch_value
+        self.port_on_cmd = "ubntbox swctrl port set down id {}".format(self.port_id)
+        self.port_off_cmd = "ubntbox swctrl port set up id {}".format(self.port_id)
+        self.poe_on_cmd = "ubntbox swctrl poe set auto id {}".format(self.port_id)
+        self.poe_off_cmd = "ubntbox swctrl poe set off id {}".format(self.port_id)
+
+    @property
+    def target(self):
+        return "POEPLUS:{}".format(self.switch_login.split("@")[-1])
+
+    def prepare(self):
+        return REBOOT_PORT_DISABLED if self.check_overload() else REBOOT_DONE
+
+    def check_overload(self):
+        """ disable the port after a poe overload, returns True if the port was disabled """
+        # Check log for errors
+        try:
+            latest_entry = _switch_log_cache.get_latest_port_event(self.switch_login, self.port_id)
+        except Exception as e:
+            logging.error("failed to read log: {}".format(e))
+            return False
+
+        try:
+            if latest_entry is not None and time.time() * 1000 - latest_entry['timestamp_ms'] < 3600 * 1000:
+                # check error in last message
+                keyword = "EVT_SW_PoeOverload"
+                if keyword in latest_entry['message']:
+                    logging.info(f"Keyword '{keyword}' was found in error logs.")
+                    logging.info(f'shutting down port on switch')
+                    ssh_switch_command(self.switch_login, "{} && {}".format(self.port_off_cmd, self.poe_off_cmd))
+                    return True
+                else:
+                    logging.info(f"Keyword '{keyword}' was not found in error logs.")
+                    logging.info(f'enabling port on switch')
+                    ssh_switch_command(self.switch_login, "{} && {}".format(self.port_on_cmd, self.poe_on_cmd))
+        except Exception:
+            logging.error("failed to activate/deaktivate port on switch")
+        return False
+
+    def _power_off(self):
+        logging.debug("shutting down port on switch")
+        try:
+            ssh_switch_command(self.switch_login, self.poe_off_cmd)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+            logging.error("failed to fire poe port reset")
+
+    def _power_on(self):
+        logging.debug("activating port on switch")
+        try:
+            ssh_switch_command(self.switch_login, self.poe_on_cmd)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+            logging.error("failed to fire poe port reset")
+
+
+## SNMP
+@register_driver('SNMP')
+class SnmpDriver(PowerSwitchDriver):
+
+    def __init__(self, switch_option, switch_value):
+        super(SnmpDriver, self).__init__(switch_option, switch_value)
+        self.snmp_host = switch_option.split(";")[0]
+        self.snmp_community = switch_option.split(";")[1]
+        self.outlets = switch_value.split(",")
+
+    @staticmethod
+    def set_outlets(snmp_host, snmp_community, outlets, value):
+        """ set all outlets of a PDU to the value with a single SNMP set request """
+        snmp_args = ['snmpset', '-v', _settings['snmp_version'], '-c', snmp_community, snmp_host]
+        for outlet in outlets:
+            snmp_args += ["{}.{}".format(_settings['snmp_outlet_oid'], outlet), 'i', str(value)]
+        try:
+            subprocess.check_output(snmp_args, timeout=_settings['snmp_timeout'])
+        except (OSError, subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            logging.error("failed to switch snmp outlets: {}".format(e))
+
+    def _power_off(self):
+        logging.info("turn SNMP PowerSwitch off")
+        self.set_outlets(self.snmp_host, self.snmp_community, self.outlets, _settings['snmp_outlet_off'])
+
+    def _power_on(self):
+        logging.info("turn SNMP PowerSwitch on")
+        self.set_outlets(self.snmp_host, self.snmp_community, self.outlets, _settings['snmp_outlet_on'])
+
+    @classmethod
+    def power_batch(cls, drivers, power_on):
+        # all outlets of the same PDU in one request
+        pdus = {}
+        for driver in drivers:
+            pdus.setdefault((driver.snmp_host, driver.snmp_community), []).extend(driver.outlets)
+        value = _settings['snmp_outlet_on'] if power_on else _settings['snmp_outlet_off']
+        for (snmp_host, snmp_community), outlets in pdus.items():
+            logging.info("turn SNMP PowerSwitch {} {}".format(snmp_host, "on" if power_on else "off"))
+            cls.set_outlets(snmp_host, snmp_community, outlets, value)
+
+
+## PB (USB POWER BOARD)
+_powerboards = {}
+_powerboards_lock = Lock()
+
+
+@register_driver('PB')
+class PowerBoardDriver(PowerSwitchDriver):
+
+    def __init__(self, switch_option, switch_value):
+        super(PowerBoardDriver, self).__init__(switch_option, switch_value)
+        self.pb_port = switch_option
+        self.relays = [int(relay) for relay in switch_value.split(",")]
+
+    @staticmethod
+    def set_relays(pb_port, relays, state):
+        """ switch relays of a usb power board, the serial port stays open and all relay commands are sent at once.
+        pyserial is only needed for PB devices and is imported on the first use """
+        import serial
+
+        with _powerboards_lock:
+            if pb_port not in _powerboards:
+                _powerboards[pb_port] = {'serial': serial.serial_for_url(pb_port, baudrate=_settings['pb_baudrate'],
+                                                                         timeout=1),
+                                         'lock': Lock()}
+            powerboard = _powerboards[pb_port]
+
+        # relay frame: start byte, relay number, state and checksum
+        frames = b''
+        for relay in relays:
+            frame = bytes([0xA0, relay, 1 if state else 0])
+            frames += frame + bytes([sum(frame) & 0xFF])
+
+        with powerboard['lock']:
+            try:
+                powerboard['serial'].write(frames)
+                powerboard['serial'].flush()
+            except serial.SerialException:
+                # reopen the port on the next call
+                powerboard['serial'].close()
+                with _powerboards_lock:
+                    _powerboards.pop(pb_port, None)
+                raise
+
+    def _switch(self, state):
+        try:
+            self.set_relays(self.pb_port, self.relays, state)
+        except (ImportError, OSError, ValueError) as e:
+            logging.error("failed to switch power board relays: {}".format(e))
+
+    def _power_off(self):
+        logging.info("turn PB PowerSwitch off")
+        self._switch(False)
+
+    def _power_on(self):
+        logging.info("turn PB PowerSwitch on")
+        self._switch(True)
+
+    @classmethod
+    def power_batch(cls, drivers, power_on):
+        # all relays of the same board in one write
+        boards = {}
+        for driver in drivers:
+            boards.setdefault(driver.pb_port, []).extend(driver.relays)
+        for pb_port, relays in boards.items():
+            logging.info("turn PB PowerSwitch {} {}".format(pb_port, "on" if power_on else "off"))
+            try:
+                cls.set_relays(pb_port, relays, power_on)
+            except (ImportError, OSError, ValueError) as e:
+                logging.error("failed to switch power board relays: {}".format(e))
@@ -13,47 +13,110 @@ import os
 import sys
 import time
 import datetime
-import re
 import json
+import random
+import signal
+import asyncio
+import socket
+import sqlite3
 import requests
 import configparser
 import subprocess
 import logging
 import logging.handlers
-from threading import Thread
+from contextlib import contextmanager
+from threading import Thread, Event, Lock, BoundedSemaphore
+from concurrent.futures import ThreadPoolExecutor
 import prometheus_client
+from prometheus_client.core import GaugeMetricFamily
+import powerSwitch
 
 ## read config
 _config = configparser.ConfigParser()
 _rootdir = os.path.dirname(os.path.abspath('rebootMadDevice.py'))
-_config.read(_rootdir + '/config/config.ini')
+_config_file = _rootdir + '/config/config.ini'
+_config.read(_config_file)
 _device_config = (_rootdir + '/config/devices.json')
-_adb_path = _config.get("ENVIROMENT", "ADB_PATH", fallback='/usr/bin')
-_adb_port = _config.get("ENVIROMENT", "ADB_PORT", fallback='5555')
-_log_mode = _config.get("LOGGING", "LOG_MODE", fallback='console')
-_log_level = _config.get("LOGGING", "LOG_LEVEL", fallback='INFO')
-_log_filename = _config.get("LOGGING", "LOG_FILENAME", fallback='RMDClient.log')
-_api_rotom_secret = _config.get("ROTOMAPI", "API_ROTOM_SECRET", fallback=None)
-_api_endpoint_status = _config.get("ROTOMAPI", "API_ENDPOINT_STATUS")
-_prometheus_enable = _config.getboolean("PROMETHEUS", "PROMETHEUS_ENABLE", fallback=False)
-_prometheus_port = _config.get("PROMETHEUS", "PROMETHEUS_PORT", fallback=8000)
-_prometheus_device_location = _config.get("PROMETHEUS", "PROMETHEUS_DEVICE_LOCATION", fallback="")
-_try_adb_first = _config.get("REBOOTOPTIONS", "TRY_ADB_FIRST")
-_try_restart_mapper_first = _config.get("REBOOTOPTIONS", "TRY_RESTART_MAPPER_FIRST", fallback='False')
-_sleeptime_between_check = _config.get("REBOOTOPTIONS", "SLEEPTIME_BETWEEN_CHECK", fallback=5)
-_proto_timeout = _config.get("REBOOTOPTIONS", "PROTO_TIMEOUT", fallback=300)
-_force_reboot_timeout = _config.get("REBOOTOPTIONS", "FORCE_REBOOT_TIMEOUT", fallback=1800)
-_force_reboot_waittime = _config.get("REBOOTOPTIONS", "FORCE_REBOOT_WAITTIME", fallback=3600)
-_reboot_waittime = _config.get("REBOOTOPTIONS", "REBOOT_WAITTIME", fallback=300)
-_off_on_sleep = _config.get("REBOOTOPTIONS", "OFF_ON_SLEEP", fallback=5)
-_max_poe_reboot = _config.get("REBOOTOPTIONS", "MAX_POE_REBOOT", fallback=10)
-_discord_webhook_enable = _config.getboolean("DISCORD", "WEBHOOK", fallback=False)
-_discord_webhook_url = _config.get("DISCORD", "WEBHOOK_URL", fallback='')
-_gpio_usage = _config.get("GPIO", "GPIO_USAGE")
+
+
+def read_config(config):
+    """ settings from config.ini, the values are applied to the module globals at once.
+    All values are converted here, so a bad value raises before any setting is applied """
+    return {
+        '_adb_path': config.get("ENVIROMENT", "ADB_PATH", fallback='/usr/bin'),
+        '_adb_port': config.get("ENVIROMENT", "ADB_PORT", fallback='5555'),
+        '_adb_server_host': config.get("ENVIROMENT", "ADB_SERVER_HOST", fallback='127.0.0.1'),
+        '_adb_server_port': config.getint("ENVIROMENT", "ADB_SERVER_PORT", fallback=5037),
+        '_adb_timeout': config.getfloat("ENVIROMENT", "ADB_TIMEOUT", fallback=10),
+        '_adb_devices_cache_ttl': config.getfloat("ENVIROMENT", "ADB_DEVICES_CACHE_TTL", fallback=10),
+        '_adb_connect_timeout': config.getfloat("ENVIROMENT", "ADB_CONNECT_TIMEOUT", fallback=5),
+        '_adb_connect_workers': config.getint("ENVIROMENT", "ADB_CONNECT_WORKERS", fallback=16),
+        '_state_db': config.get("ENVIROMENT", "STATE_DB", fallback=_rootdir + '/config/rmd_state.db'),
+        '_state_save_interval': config.getfloat("ENVIROMENT", "STATE_SAVE_INTERVAL", fallback=60),
+        '_log_mode': config.get("LOGGING", "LOG_MODE", fallback='console'),
+        '_log_level': config.get("LOGGING", "LOG_LEVEL", fallback='INFO'),
+        '_log_filename': config.get("LOGGING", "LOG_FILENAME", fallback='RMDClient.log'),
+        '_api_rotom_secret': config.get("ROTOMAPI", "API_ROTOM_SECRET", fallback=None),
+        '_api_endpoint_status': config.get("ROTOMAPI", "API_ENDPOINT_STATUS"),
+        '_api_connect_timeout': config.getfloat("ROTOMAPI", "API_CONNECT_TIMEOUT", fallback=5),
+        '_api_read_timeout': config.getfloat("ROTOMAPI", "API_READ_TIMEOUT", fallback=30),
+        '_api_retry_backoff': config.getfloat("ROTOMAPI", "API_RETRY_BACKOFF", fallback=1),
+        '_api_retry_max_backoff': config.getfloat("ROTOMAPI", "API_RETRY_MAX_BACKOFF", fallback=60),
+        '_api_stream_parse': config.getboolean("ROTOMAPI", "API_STREAM_PARSE", fallback=False),
+        '_prometheus_enable': config.getboolean("PROMETHEUS", "PROMETHEUS_ENABLE", fallback=False),
+        '_prometheus_port': config.getint("PROMETHEUS", "PROMETHEUS_PORT", fallback=8000),
+        '_prometheus_device_location': config.get("PROMETHEUS", "PROMETHEUS_DEVICE_LOCATION", fallback=""),
+        '_try_adb_first': config.getboolean("REBOOTOPTIONS", "TRY_ADB_FIRST"),
+        '_try_restart_mapper_first': config.getboolean("REBOOTOPTIONS", "TRY_RESTART_MAPPER_FIRST", fallback=False),
+        '_sleeptime_between_check': config.getint("REBOOTOPTIONS", "SLEEPTIME_BETWEEN_CHECK", fallback=5),
+        '_proto_timeout': config.getint("REBOOTOPTIONS", "PROTO_TIMEOUT", fallback=300),
+        '_force_reboot_timeout': config.getint("REBOOTOPTIONS", "FORCE_REBOOT_TIMEOUT", fallback=1800),
+        '_force_reboot_waittime': config.getint("REBOOTOPTIONS", "FORCE_REBOOT_WAITTIME", fallback=3600),
+        '_reboot_waittime': config.getint("REBOOTOPTIONS", "REBOOT_WAITTIME", fallback=300),
+        '_mapper_restart_timeout': config.getfloat("REBOOTOPTIONS", "MAPPER_RESTART_TIMEOUT", fallback=60),
+        '_max_parallel_reboots': config.getint("REBOOTOPTIONS", "MAX_PARALLEL_REBOOTS", fallback=10),
+        '_power_target_concurrency': config.getint("REBOOTOPTIONS", "POWER_TARGET_CONCURRENCY", fallback=2),
+        '_power_target_min_interval': config.getfloat("REBOOTOPTIONS", "POWER_TARGET_MIN_INTERVAL", fallback=1),
+        '_power_batch_window': config.getfloat("REBOOTOPTIONS", "POWER_BATCH_WINDOW", fallback=1),
+        '_max_poe_reboot': config.getint("REBOOTOPTIONS", "MAX_POE_REBOOT", fallback=10),
+        '_discord_webhook_enable': config.getboolean("DISCORD", "WEBHOOK", fallback=False),
+        '_discord_webhook_url': config.get("DISCORD", "WEBHOOK_URL", fallback=''),
+        '_discord_batch_window': config.getfloat("DISCORD", "WEBHOOK_BATCH_WINDOW", fallback=2),
+        '_discord_timeout': config.getfloat("DISCORD", "WEBHOOK_TIMEOUT", fallback=10),
+    }
+
+
+globals().update(read_config(_config))
+
+## settings which are only used at startup and need a restart of RMD
+_startup_settings = ('_adb_server_host', '_adb_server_port', '_adb_connect_workers', '_state_db', '_log_mode',
+                     '_log_level', '_log_filename', '_api_stream_parse', '_prometheus_enable', '_prometheus_port',
+                     '_max_parallel_reboots', '_power_target_concurrency', '_power_target_min_interval',
+                     '_power_batch_window', '_discord_batch_window', '_discord_timeout')
+
+## cache of the last device status response for conditional requests
+_device_status_cache = {'etag': None, 'last_modified': None, 'data': None, 'index': None}
+
+## shared snapshot of the devices connected to adb
+_adb_devices_snapshot = {'time': None, 'devices': set()}
+_adb_devices_lock = Lock()
+_adb_server_lock = Lock()
+
+## devices with a running reboot workflow
+_rebooting_devices = set()
+
+## running reboot and power cycle tasks, the event loop only keeps weak references to tasks
+_background_tasks = set()
+
+## sqlite snapshot of the reboot bookkeeping
+_state_store = None
+
+## modification times of config.ini and devices.json for reloads
+_config_mtimes = {}
 
 
 def makeTimestamp():
-    return convert_to_milliseconds(int(time.time()))
+    return convert_to_milliseconds(time.time())
 
 
 def convert_to_seconds(milliseconds_timestamp):
@@ -64,14 +127,31 @@ def convert_to_milliseconds(seconds_timestamp):
     return int(seconds_timestamp * 1000)
 
 
-def calc_past_sec_from_now(timestamp):
-    """ calculate time between now and given timestamp in seconds """
+def calc_past_sec_from_now(timestamp, now=None):
+    """ calculate time between now (or the given now timestamp) and given timestamp in seconds """
     if not timestamp:
         return 99999
-    elif int(timestamp) > makeTimestamp():
+    if now is None:
+        now = makeTimestamp()
+    timestamp = int(timestamp)
+    if timestamp > now:
         return 0
-    diffToNow = convert_to_seconds(makeTimestamp()) - convert_to_seconds(int(timestamp))
-    return diffToNow
+    return convert_to_seconds(now - timestamp)
+
+
+class CycleContext(object):
+    """ one clock snapshot used for all decisions of a check cycle """
+    __slots__ = ('monotonic', 'now')
+
+    def __init__(self):
+        # start of the cycle, only used to schedule the next cycle
+        self.monotonic = time.monotonic()
+        self.now = makeTimestamp()
+
+    def refresh_now(self):
+        """ take the wall clock snapshot again after the device status data was fetched, the fetch and its
+        retries can take long and the data must not be compared with an older time """
+        self.now = makeTimestamp()
 
 
 def timestamp_to_readable_datetime(mstimestamp):
@@ -98,6 +178,116 @@ def printTable(myDict, colList=None):
     for item in myList: logging.info(formatStr.format(*item))
 
 
+class DeviceState(object):
+    """ config and runtime state of a device, slots keep the state of thousands of devices compact """
+    __slots__ = ('ip_address', 'mapper_mode', 'switch_mode', 'switch_option', 'switch_value', 'power_switch',
+                 'device_location', 'status', 'last_seen', 'offline_sec', 'last_reboot_time', 'reboot_count',
+                 'reboot_force', 'reboot_type', 'reboot_forced', 'last_reboot_forced_time', 'webhook_id',
+                 'saved_state')
+
+    # reboot bookkeeping which survives a restart of RMD, last_seen and status are taken from the api again
+    PERSISTENT_FIELDS = ('last_reboot_time', 'reboot_count', 'reboot_force', 'reboot_type', 'reboot_forced',
+                         'last_reboot_forced_time', 'webhook_id')
+
+    def __init__(self, device_config):
+        config = self.read_config(device_config)
+        self.set_config(config, self.create_power_switch(config))
+        self.status = 0
+        self.last_seen = None
+        self.offline_sec = calc_past_sec_from_now(None)
+        self.last_reboot_time = 1672531200000
+        self.reboot_count = 0
+        self.reboot_force = False
+        self.reboot_type = None
+        self.reboot_forced = False
+        self.last_reboot_forced_time = 1672531200000
+        self.webhook_id = 0
+        self.saved_state = None
+
+    @staticmethod
+    def read_config(device_config):
+        """ config of a devices.json entry, raises KeyError or TypeError for invalid entries """
+        return (device_config["IP_ADDRESS"], device_config["MAPPER_MODE"], device_config["SWITCH_MODE"],
+                device_config["SWITCH_OPTION"], device_config["SWITCH_VALUE"], _prometheus_device_location)
+
+    @staticmethod
+    def create_power_switch(config):
+        ip_address, mapper_mode, switch_mode, switch_option, switch_value, device_location = config
+        return powerSwitch.create_driver(switch_mode, switch_option, switch_value)
+
+    def config(self):
+        return (self.ip_address, self.mapper_mode, self.switch_mode, self.switch_option, self.switch_value,
+                self.device_location)
+
+    def set_config(self, config, power_switch):
+        (self.ip_address, self.mapper_mode, self.switch_mode, self.switch_option, self.switch_value,
+         self.device_location) = config
+        self.power_switch = power_switch
+
+    def persistent_state(self):
+        return tuple(getattr(self, field) for field in self.PERSISTENT_FIELDS)
+
+    def restore_state(self, state):
+        for field, value in zip(self.PERSISTENT_FIELDS, state):
+            setattr(self, field, value)
+        self.reboot_force = bool(self.reboot_force)
+        self.reboot_forced = bool(self.reboot_forced)
+        self.saved_state = self.persistent_state()
+
+
+class StateStore(object):
+    """ sqlite snapshot of the reboot bookkeeping, only devices which changed since the last save are written """
+
+    def __init__(self, path):
+        self._lock = Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS device_state (device TEXT PRIMARY KEY, {})".format(
+            ", ".join(DeviceState.PERSISTENT_FIELDS)))
+        self._db.commit()
+
+    def load(self, rmd_data):
+        with self._lock:
+            rows = self._db.execute("SELECT device, {} FROM device_state".format(
+                ", ".join(DeviceState.PERSISTENT_FIELDS))).fetchall()
+        restored = 0
+        for row in rows:
+            if row[0] in rmd_data:
+                rmd_data[row[0]].restore_state(row[1:])
+                restored += 1
+        logging.info("Restored state of {} devices from {}".format(restored, _state_db))
+
+    def save(self, rmd_data):
+        changedRows = []
+        for device, data in list(rmd_data.items()):
+            state = data.persistent_state()
+            if state != data.saved_state:
+                changedRows.append((device,) + state)
+                data.saved_state = state
+        if not changedRows:
+            return
+        with self._lock:
+            with self._db:
+                self._db.executemany("INSERT OR REPLACE INTO device_state (device, {}) VALUES ({})".format(
+                    ", ".join(DeviceState.PERSISTENT_FIELDS), ", ".join("?" * (len(DeviceState.PERSISTENT_FIELDS) + 1))),
+                    changedRows)
+        logging.debug("Saved state of {} devices".format(len(changedRows)))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def save_state():
+    if _state_store is None:
+        return
+    try:
+        _state_store.save(_rmd_data)
+    except sqlite3.Error as e:
+        logging.error("Saving state to {} failed: {}".format(_state_db, e))
+
+
 def initRMDdata():
     # init device dict
     rmd_data = {}
@@ -110,102 +300,258 @@ def initRMDdata():
         # init rmd data in dict
     logging.debug(f'Init device data dictionary.')
     for device in _jsondata:
-        rmd_data[device] = {'ip_address': _jsondata[device]["IP_ADDRESS"],
-                            'mapper_mode': _jsondata[device]["MAPPER_MODE"],
-                            'switch_mode': _jsondata[device]["SWITCH_MODE"],
-                            'switch_option': _jsondata[device]["SWITCH_OPTION"],
-                            'switch_value': _jsondata[device]["SWITCH_VALUE"],
-                            'device_location': _prometheus_device_location,
-                            'status': 0,
-                            'last_seen': None,
-                            'last_reboot_time': 1672531200000,
-                            'reboot_count': 0,
-                            'reboot_force': False,
-                            'reboot_type': None,
-                            'reboot_forced': False,
-                            'last_reboot_forced_time': 1672531200000,
-                            'webhook_id': 0
-                            }
+        rmd_data[device] = DeviceState(_jsondata[device])
 
     return rmd_data
 
 
+def get_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def reload_changed_config():
+    """ reload config.ini and devices.json between two cycles if they were changed """
+    for path, reload in ((_config_file, reload_config), (_device_config, reload_devices)):
+        mtime = get_mtime(path)
+        if mtime is None or mtime == _config_mtimes.get(path):
+            continue
+        try:
+            logging.info("{} was changed, reloading it".format(path))
+            if reload():
+                _config_mtimes[path] = mtime
+        except Exception as e:
+            # a bad config must not stop RMD, the changed file is tried again after its next change
+            logging.error("Reload of {} failed, keeping the current settings: {!r}".format(path, e))
+            _config_mtimes[path] = mtime
+
+
+def reload_config():
+    global _config, _api_session
+    config = configparser.ConfigParser()
+    if not config.read(_config_file):
+        raise OSError("{} not readable".format(_config_file))
+    settings = read_config(config)
+    for name in _startup_settings:
+        if settings.pop(name) != globals()[name]:
+            logging.warning("Changed setting {} is used after a restart of RMD".format(name[1:].upper()))
+
+    # swap all settings at once
+    powerSwitch.configure(config)
+    if settings['_prometheus_device_location'] != _prometheus_device_location:
+        # apply the new location to all devices
+        _config_mtimes.pop(_device_config, None)
+    globals().update(settings)
+    _config = config
+
+    # new session for a changed api secret
+    _api_session.close()
+    _api_session = init_api_session()
+    logging.info("Reloaded config.ini")
+    return True
+
+
+def reload_devices():
+    """ add, update and remove devices from devices.json, the runtime state of kept devices is preserved.
+    All entries are validated before anything is applied, so a bad entry leaves all devices unchanged """
+    with open(_device_config) as json_file:
+        _jsondata = json.load(json_file)
+    if not isinstance(_jsondata, dict):
+        raise ValueError("devices.json does not contain an object of devices")
+
+    addedDevices = {}
+    updatedDevices = {}
+    for device, device_config in _jsondata.items():
+        data = _rmd_data.get(device)
+        if data is None:
+            addedDevices[device] = DeviceState(device_config)
+            continue
+        config = DeviceState.read_config(device_config)
+        if config != data.config():
+            updatedDevices[device] = (config, DeviceState.create_power_switch(config))
+
+    complete = True
+    for device in [device for device in _rmd_data if device not in _jsondata]:
+        if device in _rebooting_devices:
+            logging.info("Device {} is removed after its running reboot".format(device))
+            complete = False
+            continue
+        del _rmd_data[device]
+        logging.info("Device {} removed".format(device))
+
+    for device, (config, power_switch) in updatedDevices.items():
+        _rmd_data[device].set_config(config, power_switch)
+        logging.info("Device {} updated".format(device))
+
+    if addedDevices:
+        if _state_store is not None:
+            _state_store.load(addedDevices)
+        _rmd_data.update(addedDevices)
+        for device in addedDevices:
+            logging.info("Device {} added".format(device))
+    return complete
+
+
+def init_api_session():
+    """ create a persistent http session for the rotom api which keeps the connection alive between cycles """
+    session = requests.Session()
+    session.headers.update({
+        'Accept': 'application/json',
+        'X-Rotom-Secret': _api_rotom_secret
+    })
+    session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2))
+    session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2))
+    return session
+
+
+def calc_retry_backoff(attempt):
+    """ exponential backoff with jitter in seconds for the given retry attempt """
+    backoff = min(_api_retry_max_backoff, _api_retry_backoff * (2 ** attempt))
+    return random.uniform(backoff / 2, backoff)
+
+
+def parse_device_status_stream(response):
+    """ stream-parse only origin and dateLastMessageReceived of the devices array """
+    response.raw.decode_content = True
+    devices = [{'origin': device_data.get('origin'),
+                'dateLastMessageReceived': device_data.get('dateLastMessageReceived')}
+               for device_data in ijson.items(response.raw, 'devices.item')]
+    # the whole body is read, hand the connection back to the session pool
+    response.raw.release_conn()
+    return {'devices': devices}
+
+
 def getDeviceStatusData():
     logging.info(f'Update device status data from API...')
-    method = "get"
     url = _api_endpoint_status
-    auth = None
-    headers = {
-        'Accept': 'application/json',
-        'X-Rotom-Secret': _api_rotom_secret
-    }
+    timeout = (_api_connect_timeout, _api_read_timeout)
+    attempt = 0
+
+    # only send conditional headers if the api supported them before
+    headers = {}
+    if _device_status_cache['data'] is not None:
+        if _device_status_cache['etag']:
+            headers['If-None-Match'] = _device_status_cache['etag']
+        if _device_status_cache['last_modified']:
+            headers['If-Modified-Since'] = _device_status_cache['last_modified']
 
     while True:
         # Get device data from rotom api
         try:
             logging.debug("Get device data from rotom api")
-            response = requests.request(method, url, headers=headers, auth=auth)
-            deviceStatusData = response.json()
+            fetch_start = time.monotonic()
+            response = _api_session.get(url, headers=headers, timeout=timeout, stream=_api_stream_parse)
+            if response.status_code == 304 and _device_status_cache['data'] is not None:
+                logging.debug("Device data of rotom api not modified, using cached data")
+                response.content  # consume the empty body to keep the connection alive
+                deviceStatusData = _device_status_cache['data']
+            else:
+                response.raise_for_status()
+                if _api_stream_parse:
+                    deviceStatusData = parse_device_status_stream(response)
+                else:
+                    deviceStatusData = response.json()
+                _device_status_cache.update({
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'data': deviceStatusData,
+                    'index': None
+                })
+            if _prometheus_enable:
+                metrics['rmd_api_fetch_duration'].observe(time.monotonic() - fetch_start)
             return deviceStatusData  # return inside the try block
 
-        except:
-            logging.error(f'Get device data from rotom api failed.')
-            logging.error(f'sleep 30s and retry')
-            time.sleep(30)  # if request fails, sleep and then retry
+        except Exception as e:
+            backoff = calc_retry_backoff(attempt)
+            attempt += 1
+            if _prometheus_enable:
+                metrics['rmd_api_fetch_retries'].inc()
+            logging.error(f'Get device data from rotom api failed: {e}')
+            logging.error(f'sleep {backoff:.1f}s and retry')
+            time.sleep(backoff)  # if request fails, sleep and then retry
+
+
+def index_device_status(deviceStatusData):
+    """ build an origin keyed index of the device status data from the api """
+    deviceStatusIndex = {}
+    for device_data in deviceStatusData.get('devices', []):
+        device_origin = device_data.get('origin')
+        if device_origin is None:
+            continue
+
+        # the same origin can be reported more than once (e.g. reconnects), keep the newest entry
+        known_data = deviceStatusIndex.get(device_origin)
+        if known_data is not None:
+            logging.debug("Device {} is reported more than once by the api.".format(device_origin))
+            if (known_data.get('dateLastMessageReceived') or 0) >= (device_data.get('dateLastMessageReceived') or 0):
+                continue
+        deviceStatusIndex[device_origin] = device_data
+
+    for device_origin in _rmd_data:
+        if device_origin not in deviceStatusIndex:
+            logging.debug("Device {} is missing in the device status data of the api.".format(device_origin))
 
+    return deviceStatusIndex
 
-def check_device(device_origin, deviceStatusData):
-    # Update data from deviceStatusData in _rmd_data set
-    if any(device['origin'] == device_origin for device in deviceStatusData['devices']):
-        device_data = next(device for device in deviceStatusData['devices'] if device['origin'] == device_origin)
-        _rmd_data[device_origin]['last_seen'] = device_data['dateLastMessageReceived']
+
+def check_device(device_origin, deviceStatusIndex, cycle):
+    device = _rmd_data[device_origin]
+
+    # Update data from deviceStatusIndex in _rmd_data set
+    device_data = deviceStatusIndex.get(device_origin)
+    if device_data is not None:
+        device.last_seen = device_data['dateLastMessageReceived']
+    device.offline_sec = calc_past_sec_from_now(device.last_seen, cycle.now)
 
     # Analyze DATA of device
     logging.debug("Checking device {} for nessessary reboot.".format(device_origin))
-    if calc_past_sec_from_now(_rmd_data[device_origin]['last_seen']) > int(_proto_timeout):
-        if _rmd_data[device_origin]['status'] == 3:
-            logging.debut("device is deaktivated")
-        elif _rmd_data[device_origin]['last_reboot_time'] is not None and calc_past_sec_from_now(
-                _rmd_data[device_origin]['last_reboot_time']) < (int(_reboot_waittime)):
-            _rmd_data[device_origin]['status'] = 1
+    if device.offline_sec > _proto_timeout:
+        if device.status == 3:
+            logging.debug("device is deaktivated")
+        elif device.last_reboot_time is not None and calc_past_sec_from_now(
+                device.last_reboot_time, cycle.now) < _reboot_waittime:
+            device.status = 1
         else:
-            _rmd_data[device_origin]['status'] = 2
-            if calc_past_sec_from_now(_rmd_data[device_origin]['last_seen']) > int(_force_reboot_timeout):
-                _rmd_data[device_origin]['reboot_force'] = True
+            device.status = 2
+            if device.offline_sec > _force_reboot_timeout:
+                device.reboot_force = True
 
     else:
-        _rmd_data[device_origin].update({
-            'reboot_force': False,
-            'reboot_count': 0,
-            'reboot_type': None,
-            'status': 0
-        })
+        device.reboot_force = False
+        device.reboot_count = 0
+        device.reboot_type = None
+        device.status = 0
 
-        # clear webhook_id after fixed message
-        if _rmd_data[device_origin]['webhook_id'] != 0:
-            logging.debug("Discord message for device {} will be updated because webhook_id is set to {}".format(device_origin, _rmd_data[device_origin]['webhook_id']))
-            discord_message(device_origin, fixed=True)
-            _rmd_data[device_origin]['webhook_id'] = 0
+        # clear webhook_id and queue the fixed message
+        webhook_id = device.webhook_id
+        if webhook_id != 0:
+            logging.debug("Discord message for device {} will be updated because webhook_id is set to {}".format(device_origin, webhook_id))
+            device.webhook_id = 0
+            _discord_dispatcher.fixed(device_origin, webhook_id)
 
 
-def check_devices():
+def check_devices(cycle):
     # API-call for device status
-    deviceStatusData = getDeviceStatusData()
+    with observe_loop_phase('get_device_status'):
+        deviceStatusData = getDeviceStatusData()
+    cycle.refresh_now()
 
-    try:
-        threads = []
-        for device in _rmd_data:
-            thread = Thread(target=check_device, args=(device, deviceStatusData))
-            thread.start()
-            threads.append(thread)
-
-        for thread in threads:
-            thread.join()
-    except:
-        logging.error(f'Error checking clients. Threads failed.')
+    # rebuild the index only if the api sent new data
+    if _device_status_cache['index'] is None:
+        _device_status_cache['index'] = index_device_status(deviceStatusData)
+    deviceStatusIndex = _device_status_cache['index']
+
+    # evaluate all devices in a single pass, discord updates are handed over to the discord dispatcher
+    for device in _rmd_data:
+        try:
+            check_device(device, deviceStatusIndex, cycle)
+        except Exception as e:
+            logging.error("Error checking device {}: {}".format(device, e))
 
 
-def check_rebooted_devices():
+def check_rebooted_devices(cycle):
     rebootedDevicedList = []
     logging.debug("Find rebooted devices for information and update discord message.")
     logging.info("")
@@ -214,20 +560,20 @@ def check_rebooted_devices():
     logging.info("---------------------------------------------")
     logging.info("")
 
-    for device in list(_rmd_data):
-        if _rmd_data[device]['status'] == 1:
+    for device, data in list(_rmd_data.items()):
+        if data.status == 1:
             rebootedDevicedList.append(
-                {'device': device, 'last_seen': timestamp_to_readable_datetime(_rmd_data[device]['last_seen']),
-                 'offline_minutes': round(calc_past_sec_from_now(_rmd_data[device]['last_seen']) / 60),
-                 'count': _rmd_data[device]['reboot_count'],
-                 'last_reboot_time': timestamp_to_readable_datetime(_rmd_data[device]['last_reboot_time']),
-                 'reboot_ago_min': round(calc_past_sec_from_now(_rmd_data[device]['last_reboot_time']) / 60),
-                 'type': _rmd_data[device]['reboot_type']})
+                {'device': device, 'last_seen': timestamp_to_readable_datetime(data.last_seen),
+                 'offline_minutes': round(data.offline_sec / 60),
+                 'count': data.reboot_count,
+                 'last_reboot_time': timestamp_to_readable_datetime(data.last_reboot_time),
+                 'reboot_ago_min': round(calc_past_sec_from_now(data.last_reboot_time, cycle.now) / 60),
+                 'type': data.reboot_type})
 
             # Update no_data time and existing Discord messages
-            if _rmd_data[device]['webhook_id'] != 0:
+            if data.webhook_id != 0:
                 logging.info('Update Discord message')
-                discord_message(device)
+                _discord_dispatcher.update(device)
 
     if not rebootedDevicedList:
         printTable([{'device': '-', 'last_seen': '-', 'offline_minutes': '-', 'count': '-', 'last_reboot_time': '-',
@@ -240,7 +586,7 @@ def check_rebooted_devices():
         logging.info("")
 
 
-def reboot_bad_devices():
+def find_bad_devices():
     ##checking for bad devices
     badDevicedList = []
     logging.debug(f'Find bad devices and reboot them.')
@@ -250,12 +596,12 @@ def reboot_bad_devices():
     logging.info(f'---------------------------------------------')
     logging.info(f'')
 
-    for device in list(_rmd_data):
-        if _rmd_data[device]['status'] >= 2:
+    for device, data in list(_rmd_data.items()):
+        if data.status >= 2:
             badDevicedList.append(
-                {'device': device, 'last_seen': timestamp_to_readable_datetime(_rmd_data[device]['last_seen']),
-                 'offline_minutes': round(calc_past_sec_from_now(_rmd_data[device]['last_seen']) / 60),
-                 'count': _rmd_data[device]['reboot_count'], 'force': _rmd_data[device]['reboot_force']})
+                {'device': device, 'last_seen': timestamp_to_readable_datetime(data.last_seen),
+                 'offline_minutes': round(data.offline_sec / 60),
+                 'count': data.reboot_count, 'force': data.reboot_force})
 
     if not badDevicedList:
         printTable([{'device': '-', 'last_seen': '-', 'offline_minutes': '-', 'count': '-', 'reboot_nessessary': '-',
@@ -265,323 +611,555 @@ def reboot_bad_devices():
         printTable(badDevicedList, ['device', 'last_seen', 'offline_minutes', 'count', 'force'])
         logging.info("")
 
-    ## reboot in threads
-    reboot_threads = []
+    return [badDevice["device"] for badDevice in badDevicedList]
 
-    for badDevice in badDevicedList:
-        reboot_thread = Thread(target=doRebootDevice, args=(badDevice["device"],))
-        reboot_thread.start()
-        reboot_threads.append(reboot_thread)
 
-    for reboot_thread in reboot_threads:
-        reboot_thread.join()
+@contextmanager
+def observe_loop_phase(phase):
+    """ measure the duration of a phase of the control loop """
+    phase_start = time.monotonic()
+    try:
+        yield
+    finally:
+        if _prometheus_enable:
+            metrics['rmd_loop_phase_duration'].labels(phase).observe(time.monotonic() - phase_start)
 
 
-def doRebootDevice(DEVICE_ORIGIN_TO_REBOOT):
-    # Create discord message
-    if _discord_webhook_enable:
-        discord_message(DEVICE_ORIGIN_TO_REBOOT)
+def check_cycle(cycle):
+    """ one status polling cycle, returns the devices which need a reboot """
+    # Start checking devices
+    with observe_loop_phase('check_devices'):
+        check_devices(cycle)
 
-    logging.info("Origin to reboot is: {}".format(DEVICE_ORIGIN_TO_REBOOT))
-    logging.info("Force option is: {}".format(_rmd_data[DEVICE_ORIGIN_TO_REBOOT]['reboot_force']))
-    logging.debug("Rebootcount is: {}".format(_rmd_data[DEVICE_ORIGIN_TO_REBOOT]['reboot_count']))
+    # Count cycles for prometheus, the device metrics are collected on scrape
+    if _prometheus_enable:
+        metrics['rmd_script_running_info'].inc()
 
-    _rmd_data[DEVICE_ORIGIN_TO_REBOOT]['reboot_count'] += 1
-    _rmd_data[DEVICE_ORIGIN_TO_REBOOT]['last_reboot_time'] = makeTimestamp()
+    # checking for rebooted devices
+    with observe_loop_phase('check_rebooted_devices'):
+        check_rebooted_devices(cycle)
 
-    if _rmd_data[DEVICE_ORIGIN_TO_REBOOT]['reboot_force'] and calc_past_sec_from_now(
-            _rmd_data[DEVICE_ORIGIN_TO_REBOOT]['last_reboot_forced_time']) > int(_force_reboot_waittime):
-        _rmd_data[DEVICE_ORIGIN_TO_REBOOT]['last_reboot_forced_time'] = makeTimestamp()
-        reboot_device_via_power(DEVICE_ORIGIN_TO_REBOOT)
+    # find devices for reboot
+    with observe_loop_phase('find_bad_devices'):
+        return find_bad_devices()
+
+
+def start_background_task(coro):
+    """ run a coroutine in its own task which is referenced until it is done """
+    task = asyncio.get_event_loop().create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+def reboot_bad_devices(badDevices, cycle):
+    """ start a reboot workflow for every bad device which is not already rebooting """
+    newBadDevices = [device for device in badDevices if device not in _rebooting_devices]
+    if not newBadDevices:
         return
+    _rebooting_devices.update(newBadDevices)
+    start_background_task(reboot_devices(newBadDevices, cycle))
 
-    try_counter = 2
 
+async def reboot_devices(badDevices, cycle):
+    loop = asyncio.get_event_loop()
+
+    with observe_loop_phase('reboot_bad_devices'):
+        ## connect devices to adb once for all reboots of this batch
+        try:
+            with observe_loop_phase('connect_bad_devices'):
+                await loop.run_in_executor(None, connect_bad_devices, badDevices, cycle)
+        except Exception as e:
+            logging.error("Error connecting devices via adb: {}".format(e))
+
+        ## every device reboots in its own task
+        await asyncio.gather(*[reboot_device(device, cycle) for device in badDevices])
+
+
+async def reboot_device(DEVICE_ORIGIN_TO_REBOOT, cycle):
+    loop = asyncio.get_event_loop()
+    reboot_start = time.monotonic()
+    rebooted = False
+    try:
+        async with _reboot_semaphore:
+            # the check cycles go on while waiting for a free reboot slot, the device may be online again
+            if _rmd_data[DEVICE_ORIGIN_TO_REBOOT].status < 2:
+                logging.info("Device {} is online again, reboot skipped".format(DEVICE_ORIGIN_TO_REBOOT))
+                return
+            rebooted = True
+            needPowerCycle = await loop.run_in_executor(_reboot_executor, doRebootDevice, DEVICE_ORIGIN_TO_REBOOT,
+                                                        cycle)
+            if needPowerCycle and _rmd_data[DEVICE_ORIGIN_TO_REBOOT].status == 0:
+                logging.info("Device {} is online again, power cycle skipped".format(DEVICE_ORIGIN_TO_REBOOT))
+            elif needPowerCycle:
+                await _power_cycle_batcher.power_cycle(DEVICE_ORIGIN_TO_REBOOT)
+    except Exception as e:
+        logging.error("Error rebooting device {}: {}".format(DEVICE_ORIGIN_TO_REBOOT, e))
+    finally:
+        _rebooting_devices.discard(DEVICE_ORIGIN_TO_REBOOT)
+        data = _rmd_data.get(DEVICE_ORIGIN_TO_REBOOT)
+        if _prometheus_enable and rebooted and data is not None:
+            metrics['rmd_reboot_duration'].labels(str(data.switch_mode), str(data.reboot_type)).observe(
+                time.monotonic() - reboot_start)
+
+
+async def rmd_main_loop():
+    loop = asyncio.get_event_loop()
+
+    # Loop for checking every configured interval, reboots run independently in their own tasks
+    lastStateSave = time.monotonic()
+    while True:
+        # apply changed config files between two cycles
+        reload_changed_config()
+
+        cycle = CycleContext()
+        try:
+            with observe_loop_phase('check_cycle'):
+                badDevices = await loop.run_in_executor(None, check_cycle, cycle)
+            # Reboot devices if nessessary
+            reboot_bad_devices(badDevices, cycle)
+        except Exception as e:
+            logging.error("Error in check cycle: {}".format(e))
+
+        # snapshot changed reboot bookkeeping
+        if cycle.monotonic - lastStateSave >= _state_save_interval:
+            lastStateSave = cycle.monotonic
+            with observe_loop_phase('save_state'):
+                await loop.run_in_executor(None, save_state)
+
+        # Waiting for next check
+        cycle_duration = time.monotonic() - cycle.monotonic
+        if cycle_duration > _sleeptime_between_check:
+            logging.warning("Check cycle took {:.1f}s, longer than the check interval".format(cycle_duration))
+            if _prometheus_enable:
+                metrics['rmd_cycle_overruns'].inc()
+        sleeptime = max(0, _sleeptime_between_check - cycle_duration)
+        logging.info("Waiting for {:.0f} seconds...".format(sleeptime))
+        await asyncio.sleep(sleeptime)
+
+
+def need_forced_reboot(DEVICE_ORIGIN_TO_REBOOT, cycle):
+    """ check if the device has to be rebooted via power without trying adb """
+    return _rmd_data[DEVICE_ORIGIN_TO_REBOOT].reboot_force and calc_past_sec_from_now(
+        _rmd_data[DEVICE_ORIGIN_TO_REBOOT].last_reboot_forced_time, cycle.now) > _force_reboot_waittime
+
+
+def connect_bad_devices(badDevices, cycle):
+    """ connect all bad devices which will be tried via adb and refresh the adb snapshot after each batch """
+    if not (_try_adb_first or _try_restart_mapper_first):
+        return
+
+    adbDevices = [device for device in badDevices if not need_forced_reboot(device, cycle)]
+    if not adbDevices:
+        return
+
+    try_counter = 2
+    connectedDevices = get_adb_connected_devices(refresh=True)
     for _ in range(try_counter):
-        if _rmd_data[DEVICE_ORIGIN_TO_REBOOT]['ip_address'] in list_adb_connected_devices():
-            logging.debug("Device {} already connected".format(DEVICE_ORIGIN_TO_REBOOT))
-
-            if eval(_try_restart_mapper_first):
-                logging.info("Try to restart {} on Device {}".format(_rmd_data[DEVICE_ORIGIN_TO_REBOOT]['mapper_mode'],
-                                                                     DEVICE_ORIGIN_TO_REBOOT))
-                return_code = restart_mapper_sw(DEVICE_ORIGIN_TO_REBOOT)
-                if return_code == 0:
-                    logging.info("Restart Mapper on Device {} was successful.".format(DEVICE_ORIGIN_TO_REBOOT))
-                    _rmd_data[DEVICE_ORIGIN_TO_REBOOT]['reboot_forced'] = False
-                    _rmd_data[DEVICE_ORIGIN_TO_REBOOT]['reboot_type'] = "MAPPER"
-                    return
-                else:
-                    logging.info(
-                        "Execute of restart Mapper on Device {} was not successful. Try rebooting the device now.".format(
-                            DEVICE_ORIGIN_TO_REBOOT))
-
-            if eval(_try_adb_first):
-                logging.info("Try to reboot Device {} via ADB. Please wait".format(DEVICE_ORIGIN_TO_REBOOT))
-                return_code = adb_reboot(DEVICE_ORIGIN_TO_REBOOT)
-
-                if return_code == 0:
-                    logging.info("Reboot via ADB of Device {} was successful.".format(DEVICE_ORIGIN_TO_REBOOT))
-                    _rmd_data[DEVICE_ORIGIN_TO_REBOOT]['reboot_forced'] = False
-                    _rmd_data[DEVICE_ORIGIN_TO_REBOOT]['reboot_type'] = "ADB"
-                    return
-                else:
-                    logging.warning("Rebooting Device {} via ADB was not possible. Using PowerSwitch...".format(
+        notConnectedDevices = [device for device in adbDevices
+                               if _rmd_data[device].ip_address not in connectedDevices]
+        if not notConnectedDevices:
+            break
+
+        # connect all devices at once
+        logging.debug("Devices {} not connected".format(", ".join(notConnectedDevices)))
+        connect_start = time.monotonic()
+        connectResults = list(_adb_executor.map(connect_device, notConnectedDevices))
+        pendingDevices = [device for device, connected in zip(notConnectedDevices, connectResults) if connected]
+
+        # poll the device list until all connected devices are ready or the deadline is reached
+        deadline = connect_start + _adb_connect_timeout
+        while True:
+            connectedDevices = get_adb_connected_devices(refresh=True)
+            for device in [device for device in pendingDevices if _rmd_data[device].ip_address in connectedDevices]:
+                connect_latency = time.monotonic() - connect_start
+                logging.debug("Device {} ready via adb after {:.1f}s".format(device, connect_latency))
+                if _prometheus_enable:
+                    metrics['rmd_adb_connect_duration'].observe(connect_latency)
+                pendingDevices.remove(device)
+            if not pendingDevices or time.monotonic() >= deadline:
+                break
+            time.sleep(0.5)
+
+        for device in pendingDevices:
+            logging.info("Device {} not ready via adb after {}s".format(device, _adb_connect_timeout))
+
+
+def doRebootDevice(DEVICE_ORIGIN_TO_REBOOT, cycle):
+    """ reboot via mapper restart or adb, returns True if the device still needs a power cycle """
+    # Create discord message
+    _discord_dispatcher.alert(DEVICE_ORIGIN_TO_REBOOT)
+
+    logging.info("Origin to reboot is: {}".format(DEVICE_ORIGIN_TO_REBOOT))
+    logging.info("Force option is: {}".format(_rmd_data[DEVICE_ORIGIN_TO_REBOOT].reboot_force))
+    logging.debug("Rebootcount is: {}".format(_rmd_data[DEVICE_ORIGIN_TO_REBOOT].reboot_count))
+
+    _rmd_data[DEVICE_ORIGIN_TO_REBOOT].reboot_count += 1
+    _rmd_data[DEVICE_ORIGIN_TO_REBOOT].last_reboot_time = makeTimestamp()
+
+    if need_forced_reboot(DEVICE_ORIGIN_TO_REBOOT, cycle):
+        _rmd_data[DEVICE_ORIGIN_TO_REBOOT].last_reboot_forced_time = makeTimestamp()
+        return True
+
+    # devices are connected by connect_bad_devices() before, only check the shared snapshot
+    if _rmd_data[DEVICE_ORIGIN_TO_REBOOT].ip_address in get_adb_connected_devices():
+        logging.debug("Device {} already connected".format(DEVICE_ORIGIN_TO_REBOOT))
+
+        if _try_restart_mapper_first:
+            logging.info("Try to restart {} on Device {}".format(_rmd_data[DEVICE_ORIGIN_TO_REBOOT].mapper_mode,
+                                                                 DEVICE_ORIGIN_TO_REBOOT))
+            return_code = restart_mapper_sw(DEVICE_ORIGIN_TO_REBOOT)
+            if return_code == 0:
+                logging.info("Restart Mapper on Device {} was successful.".format(DEVICE_ORIGIN_TO_REBOOT))
+                _rmd_data[DEVICE_ORIGIN_TO_REBOOT].reboot_forced = False
+                _rmd_data[DEVICE_ORIGIN_TO_REBOOT].reboot_type = "MAPPER"
+                return
+            else:
+                logging.info(
+                    "Execute of restart Mapper on Device {} was not successful. Try rebooting the device now.".format(
                         DEVICE_ORIGIN_TO_REBOOT))
-                    reboot_device_via_power(DEVICE_ORIGIN_TO_REBOOT)
-                    break
-        else:
-            logging.debug("Device {} not connected".format(DEVICE_ORIGIN_TO_REBOOT))
-            connect_device(DEVICE_ORIGIN_TO_REBOOT)
 
+        if _try_adb_first:
+            logging.info("Try to reboot Device {} via ADB. Please wait".format(DEVICE_ORIGIN_TO_REBOOT))
+            return_code = adb_reboot(DEVICE_ORIGIN_TO_REBOOT)
+
+            if return_code == 0:
+                logging.info("Reboot via ADB of Device {} was successful.".format(DEVICE_ORIGIN_TO_REBOOT))
+                _rmd_data[DEVICE_ORIGIN_TO_REBOOT].reboot_forced = False
+                _rmd_data[DEVICE_ORIGIN_TO_REBOOT].reboot_type = "ADB"
+                return
+            else:
+                logging.warning("Rebooting Device {} via ADB was not possible. Using PowerSwitch...".format(
+                    DEVICE_ORIGIN_TO_REBOOT))
     else:
-        reboot_device_via_power(DEVICE_ORIGIN_TO_REBOOT)
-        return
+        logging.debug("Device {} not connected".format(DEVICE_ORIGIN_TO_REBOOT))
+
+    return True
+
+
+class AdbError(Exception):
+    """ error reported by the adb server """
+
+
+def adb_recv_exactly(adb_socket, length):
+    data = b''
+    while len(data) < length:
+        chunk = adb_socket.recv(length - len(data))
+        if not chunk:
+            raise AdbError("connection to adb server closed")
+        data += chunk
+    return data
+
+
+def adb_recv_string(adb_socket):
+    """ read a hex length prefixed string of the adb wire protocol """
+    length = int(adb_recv_exactly(adb_socket, 4), 16)
+    return adb_recv_exactly(adb_socket, length).decode("utf-8", errors="replace")
+
+
+def adb_send_request(adb_socket, request):
+    """ send a request to the adb server and check the OKAY/FAIL status """
+    payload = request.encode("utf-8")
+    adb_socket.sendall("{:04x}".format(len(payload)).encode("ascii") + payload)
+    status = adb_recv_exactly(adb_socket, 4)
+    if status == b'FAIL':
+        raise AdbError(adb_recv_string(adb_socket))
+    elif status != b'OKAY':
+        raise AdbError("unexpected answer from adb server: {}".format(status))
+
+
+def adb_open_socket():
+    address = (_adb_server_host, _adb_server_port)
+    try:
+        return socket.create_connection(address, timeout=_adb_timeout)
+    except ConnectionRefusedError:
+        # the adb server is gone, start it again like the adb command line client does
+        with _adb_server_lock:
+            try:
+                return socket.create_connection(address, timeout=_adb_timeout)
+            except ConnectionRefusedError:
+                launch_adb_server()
+        return socket.create_connection(address, timeout=_adb_timeout)
+
+
+@contextmanager
+def observe_adb_command(command):
+    """ measure the latency of an adb command, failed commands included """
+    command_start = time.monotonic()
+    try:
+        yield
+    finally:
+        if _prometheus_enable:
+            metrics['rmd_adb_command_duration'].labels(command).observe(time.monotonic() - command_start)
+
+
+def adb_host_command(request):
+    """ execute a host command (e.g. host:devices) on the local adb server and return the answer """
+    # label without arguments like the device address of host:connect
+    with observe_adb_command(":".join(request.split(":")[:2])), adb_open_socket() as adb_socket:
+        adb_send_request(adb_socket, request)
+        return adb_recv_string(adb_socket)
+
+
+def adb_device_command(device_serial, request):
+    """ execute a command (e.g. reboot: or shell:) on a device via the local adb server and return the output """
+    with observe_adb_command(request.split(":")[0]), adb_open_socket() as adb_socket:
+        adb_send_request(adb_socket, "host:transport:{}".format(device_serial))
+        adb_send_request(adb_socket, request)
+        output = b''
+        while True:
+            chunk = adb_socket.recv(4096)
+            if not chunk:
+                break
+            output += chunk
+        return output.decode("utf-8", errors="replace")
+
+
+def launch_adb_server():
+    logging.info("adb server not running. Starting adb server.")
+    try:
+        subprocess.check_output(["{}/adb".format(_adb_path), "start-server"], timeout=30)
+    except (OSError, subprocess.SubprocessError):
+        logging.error("Starting adb server failed")
+
+
+def start_adb_server():
+    """ make sure the local adb server is running, it is started again by adb_open_socket() if it stops later """
+    try:
+        adb_host_command("host:version")
+    except (OSError, AdbError) as e:
+        logging.error("adb server not usable: {}".format(e))
 
 
 def list_adb_connected_devices():
-    cmd = "{}/adb devices | /bin/grep {}".format(_adb_path, _adb_port)
     try:
-        connectedDevices = subprocess.check_output([cmd], shell=True)
-        connectedDevices = str(connectedDevices).replace("b'", "").replace("\\n'", "").replace(":5555", "").replace(
-            "\\n", ",").replace("\\tdevice", "").split(",")
-    except subprocess.CalledProcessError:
-        connectedDevices = ()
+        deviceList = adb_host_command("host:devices")
+    except (OSError, AdbError) as e:
+        logging.error("Listing devices via adb failed: {}".format(e))
+        return set()
+
+    connectedDevices = set()
+    for line in deviceList.splitlines():
+        try:
+            device_serial, device_state = line.split("\t")
+        except ValueError:
+            continue
+        host, _, port = device_serial.rpartition(":")
+        if port == str(_adb_port) and device_state == "device":
+            connectedDevices.add(host)
     return connectedDevices
 
 
+def get_adb_connected_devices(refresh=False):
+    """ shared snapshot of the devices connected to adb, refreshed after ADB_DEVICES_CACHE_TTL seconds """
+    with _adb_devices_lock:
+        if refresh or _adb_devices_snapshot['time'] is None or \
+                time.monotonic() - _adb_devices_snapshot['time'] > _adb_devices_cache_ttl:
+            _adb_devices_snapshot['devices'] = list_adb_connected_devices()
+            _adb_devices_snapshot['time'] = time.monotonic()
+        return _adb_devices_snapshot['devices']
+
+
 def connect_device(DEVICE_ORIGIN_TO_REBOOT):
-    cmd = "{}/adb connect {}".format(_adb_path, _rmd_data[DEVICE_ORIGIN_TO_REBOOT]['ip_address'])
     try:
-        subprocess.check_output([cmd], shell=True)
-    except subprocess.CalledProcessError:
+        answer = adb_host_command("host:connect:{}:{}".format(_rmd_data[DEVICE_ORIGIN_TO_REBOOT].ip_address, _adb_port))
+        logging.debug("adb connect of device {}: {}".format(DEVICE_ORIGIN_TO_REBOOT, answer))
+        if "connected to" in answer:
+            return True
         logging.info("Connection via adb failed")
-    # Wait for 2 seconds
-    time.sleep(2)
+    except (OSError, AdbError):
+        logging.info("Connection via adb failed")
+    return False
 
 
-def restart_mapper_sw(DEVICE_ORIGIN_TO_REBOOT):
-    _adbloc = "{}/adb".format(_adb_path)
-    _deviceloc = "{}:{}".format(_rmd_data[DEVICE_ORIGIN_TO_REBOOT]['ip_address'], _adb_port)
-    _mapperscript = "{}/mapperscripts/restart{}.sh".format(_rootdir, _rmd_data[DEVICE_ORIGIN_TO_REBOOT]['mapper_mode'])
+def run_supervised(args, timeout):
+    """ run a child process, wait for its exit code and make sure it is reaped even after a timeout """
     try:
-        subprocess.Popen([_mapperscript, _adbloc, _deviceloc])
-        return 0
-    except:
+        # own process group, so children of scripts can be killed as well
+        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, start_new_session=True)
+    except OSError as e:
+        logging.error("Starting {} failed: {}".format(args[0], e))
         return 1
 
-
-def adb_reboot(DEVICE_ORIGIN_TO_REBOOT):
-    _adbloc = "{}/adb".format(_adb_path)
-    _deviceloc = "{}:{}".format(_rmd_data[DEVICE_ORIGIN_TO_REBOOT]['ip_address'], _adb_port)
     try:
-        subprocess.Popen([_adbloc, '-s', _deviceloc, 'reboot'])
-        return 0
-    except:
+        output, _ = process.communicate(timeout=float(timeout))
+    except subprocess.TimeoutExpired:
+        logging.error("{} did not finish within {}s and will be killed".format(args[0], timeout))
+        os.killpg(process.pid, signal.SIGKILL)
+        process.communicate()
         return 1
 
+    logging.debug("{} finished with exit code {}: {}".format(args[0], process.returncode,
+                                                             output.decode("utf-8", errors="replace").strip()))
+    return process.returncode
 
-def reboot_device_via_power(DEVICE_ORIGIN_TO_REBOOT):
-    ## read powerSwitch config
-    powerSwitchMode = _rmd_data[DEVICE_ORIGIN_TO_REBOOT]['switch_mode']
-    powerSwitchOption = _rmd_data[DEVICE_ORIGIN_TO_REBOOT]['switch_option']
-    powerSwitchValue = _rmd_data[DEVICE_ORIGIN_TO_REBOOT]['switch_value']
-
-    ## setting data for webhook
-    _rmd_data[DEVICE_ORIGIN_TO_REBOOT]['reboot_forced'] = True
-    _rmd_data[DEVICE_ORIGIN_TO_REBOOT]['reboot_type'] = powerSwitchMode
-
-    ## HTML
-    if powerSwitchMode == 'HTML':
-        logging.debug("PowerSwitch with HTML starting.")
-        poweron = powerSwitchValue.split(";")[0]
-        poweroff = powerSwitchValue.split(";")[1]
-        logging.info("turn HTTP PowerSwitch off")
-        requests.get(poweroff)
-        time.sleep(int(_off_on_sleep))
-        logging.info("turn HTTP PowerSwitch on")
-        requests.get(poweron)
-        logging.debug("PowerSwitch with HTML done.")
-        return
 
-        ## GPIO
-    elif powerSwitchMode == 'GPIO':
-        logging.debug("PowerSwitch with GPIO starting.")
-        relay_mode = powerSwitchOption.split(";")[0]
-        cleanup_mode = powerSwitchOption.split(";")[1]
-        gpionr = int(powerSwitchValue)
-        logging.info("turn GPIO PowerSwitch off")
-        GPIO.setwarnings(False)
-        GPIO.setmode(GPIO.BCM)
+def restart_mapper_sw(DEVICE_ORIGIN_TO_REBOOT):
+    _adbloc = "{}/adb".format(_adb_path)
+    _deviceloc = "{}:{}".format(_rmd_data[DEVICE_ORIGIN_TO_REBOOT].ip_address, _adb_port)
+    _mapperscript = "{}/mapperscripts/restart{}.sh".format(_rootdir, _rmd_data[DEVICE_ORIGIN_TO_REBOOT].mapper_mode)
+    return run_supervised([_mapperscript, _adbloc, _deviceloc], _mapper_restart_timeout)
 
-        try:
-            eval(cleanup_mode)
-        except:
-            cleanup_mode = "False"
-
-        if eval(cleanup_mode):
-            GPIO.cleanup()
-            logging.info("GPIO cleanup done!")
-
-        if relay_mode == 'NO':
-            logging.debug("Relay_mode: " + relay_mode)
-            # GPIO.setup(gpionr, GPIO.OUT, initial=GPIO.HIGH)
-            logging.debug("setting GPIO setup to: GPIO.OUT")
-            GPIO.setup(gpionr, GPIO.OUT)
-            logging.debug("setting GPIO output to: GPIO.HIGH")
-            GPIO.output(gpionr, GPIO.HIGH)
-        elif relay_mode == 'NC':
-            logging.debug("Relay_mode: " + relay_mode)
-            # GPIO.setup(gpionr, GPIO.OUT, initial=GPIO.LOW)
-            logging.debug("setting GPIO setup to: GPIO.OUT")
-            GPIO.setup(gpionr, GPIO.OUT)
-            logging.debug("setting GPIO output to: GPIO.LOW")
-            GPIO.output(gpionr, GPIO.LOW)
-        else:
-            logging.error("wrong relay_mode in config")
-        logging.debug("sleeping 10s")
-        time.sleep(int(_off_on_sleep))
-        logging.info("turn GPIO PowerSwitch on")
-        if relay_mode == 'NO':
-            logging.debug("Relay_mode: " + relay_mode)
-            # GPIO.output(gpionr, GPIO.LOW)
-            logging.debug("setting GPIO setup to: GPIO.OUT")
-            GPIO.setup(gpionr, GPIO.OUT)
-            logging.debug("setting GPIO output to: GPIO.LOW")
-            GPIO.output(gpionr, GPIO.LOW)
-        elif relay_mode == 'NC':
-            logging.debug("Relay_mode: " + relay_mode)
-            # GPIO.output(gpionr, GPIO.HIGH)
-            logging.debug("setting GPIO setup to: GPIO.OUT")
-            GPIO.setup(gpionr, GPIO.OUT)
-            logging.debug("setting GPIO output to: GPIO.HIGH")
-            GPIO.output(gpionr, GPIO.HIGH)
-        else:
-            logging.error("wrong relay_mode in config")
 
-        if eval(cleanup_mode):
-            GPIO.cleanup()
-            logging.info("GPIO cleanup done!")
-        logging.debug("PowerSwitch with GPIO done.")
-        return
+def adb_reboot(DEVICE_ORIGIN_TO_REBOOT):
+    _deviceloc = "{}:{}".format(_rmd_data[DEVICE_ORIGIN_TO_REBOOT].ip_address, _adb_port)
+    try:
+        # the adb server answers FAIL if the device is not reachable, so OKAY means the device got the reboot
+        adb_device_command(_deviceloc, "reboot:")
+        return 0
+    except (OSError, AdbError) as e:
+        logging.error("Reboot of device {} via adb failed: {}".format(DEVICE_ORIGIN_TO_REBOOT, e))
+        return 1
 
-    ## CMD
-    elif powerSwitchMode == 'CMD':
-        logging.debug("PowerSwitch with CMD starting.")
-        try:
-            subprocess.check_output(powerSwitchValue, shell=True)
-        except subprocess.CalledProcessError:
-            logging.error("failed to fire command")
-        logging.debug("PowerSwitch with CMD done.")
-        _rmd_data[DEVICE_ORIGIN_TO_REBOOT]['reboot_forced'] = True
-        _rmd_data[DEVICE_ORIGIN_TO_REBOOT]['reboot_type'] = "CMD"
-        return
 
-    ## SCRIPT
-    elif powerSwitchMode == 'SCRIPT':
-        logging.debug("PowerSwitch with SCRIPT starting.")
-        poweron = powerSwitchValue.split(";")[0]
-        poweroff = powerSwitchValue.split(";")[1]
-        logging.info("execute script for PowerSwitch off")
-        try:
-            subprocess.check_output(poweroff, shell=True)
-        except subprocess.CalledProcessError:
-            logging.error("failed to start script")
-        time.sleep(int(_off_on_sleep))
-        logging.info("execute script for PowerSwitch on")
-        try:
-            subprocess.check_output(poweron, shell=True)
-        except subprocess.CalledProcessError:
-            logging.error("failed to start script")
-        logging.debug("PowerSwitch with SCRIPT done.")
-        return
+class PowerTargetLimiter(object):
+    """ limits concurrent and too frequent power operations on the same physical power target """
 
-    ## POE
-    elif powerSwitchMode == 'POE':
-        logging.debug("PowerSwitch with POE starting.")
-        try:
-            subprocess.check_output(powerSwitchValue, shell=True)
-        except subprocess.CalledProcessError:
-            logging.error("failed to fire poe port reset")
-        logging.debug("PowerSwitch with POE done.")
-        return
+    def __init__(self, concurrency, min_interval):
+        self._concurrency = concurrency
+        self._min_interval = min_interval
+        self._lock = Lock()
+        self._semaphores = {}
+        self._next_start = {}
+        self._queue_depth = {}
 
-    ## POE PLUS (UNIFI)
-    elif powerSwitchMode == 'POEPLUS':
-        logging.debug("PowerSwitch with POE PLUS starting.")
-        PORT_ID = powerSwitchOption
-        SWITCH_LOGIN = powerSwitchValue
-        PORT_ON_CMD = "ssh {} 'ubntbox swctrl port set down id {}'".format(SWITCH_LOGIN, PORT_ID)
-        PORT_OFF_CMD = "ssh {} 'ubntbox swctrl port set up id {}'".format(SWITCH_LOGIN, PORT_ID)
-        POE_ON_CMD = "ssh {} 'ubntbox swctrl poe set auto id {}'".format(SWITCH_LOGIN, PORT_ID)
-        POE_OFF_CMD = "ssh {} 'ubntbox swctrl poe set off id {}'".format(SWITCH_LOGIN, PORT_ID)
-        # Check log for errors
-        try:
-            GREP_LOG_CMD = "ssh {} 'cat /var/log/messages | grep Port | grep {}'".format(SWITCH_LOGIN, PORT_ID)
-            # execute command and get output
-            output_bytes = subprocess.check_output(GREP_LOG_CMD, shell=True)
-            # Decode Byte-String to normal String
-            output_str = output_bytes.decode("utf-8")
-
-            log_entries = []
-            for line in output_str.split('\n'):
-                if not line:
-                    continue
-                match = re.match(r'(\S+\s+\d+\s\d+:\d+:\d+)\s(\S+)\s.*switch:\s(.+)', line)
-                if match:
-                    date_time, host, message = match.groups()
-                    default_year = str(datetime.datetime.now().year)
-                    date_time = f'{date_time} {default_year}'
-                    dt_object = datetime.datetime.strptime(date_time, '%b %d %H:%M:%S %Y')
-                    timestamp_ms = int(dt_object.timestamp() * 1000)
-                    log_entries.append({
-                        'timestamp_ms': timestamp_ms,
-                        'host': host,
-                        'message': message
-                    })
-        except:
-            logging.error("failed to grep log")
+    def _update_queue_depth(self, target, change):
+        with self._lock:
+            self._queue_depth[target] = self._queue_depth.get(target, 0) + change
+            queue_depth = self._queue_depth[target]
+        if _prometheus_enable:
+            metrics['rmd_power_target_queue_depth'].labels(target).set(queue_depth)
 
-        try:
-            # sort list for timestemp_ms desc
-            sorted_entries = sorted(log_entries, key=lambda x: x['timestamp_ms'], reverse=True)
-            # take newest entry after sort
-            latest_entry = sorted_entries[0]
-
-            if calc_past_sec_from_now(latest_entry['timestamp_ms']) < 3600:
-                # check error in last message
-                latest_message = latest_entry['message']
-                # Suche nach dem gewünschten Teil in der Meldung
-                keyword = "EVT_SW_PoeOverload"
-                if keyword in latest_message:
-                    logging.info(f"Keyword '{keyword}' was found in error logs.")
-                    logging.info(f'shutting down port on switch')
-                    subprocess.check_output(PORT_OFF_CMD, shell=True)
-                    subprocess.check_output(POE_OFF_CMD, shell=True)
-                    _rmd_data[DEVICE_ORIGIN_TO_REBOOT]['status'] = 3
-                    return
-                else:
-                    logging.info(f"Keyword '{keyword}' was not found in error logs.")
-                    logging.info(f'enabling port on switch')
-                    subprocess.check_output(PORT_ON_CMD, shell=True)
-                    subprocess.check_output(POE_ON_CMD, shell=True)                    
-        except:
-            logging.error("failed to activate/deaktivate port on switch")
+    @contextmanager
+    def acquire(self, target):
+        with self._lock:
+            semaphore = self._semaphores.setdefault(target, BoundedSemaphore(self._concurrency))
 
+        wait_start = time.monotonic()
+        self._update_queue_depth(target, 1)
+        semaphore.acquire()
         try:
-            logging.debug("shutting down port on switch")
-            subprocess.check_output(POE_OFF_CMD, shell=True)
-            logging.debug("waittime before activating port again")
-            time.sleep(int(_off_on_sleep))
-            logging.debug("activating port on switch")
-            subprocess.check_output(POE_ON_CMD, shell=True)
-        except subprocess.CalledProcessError:
-            logging.error("failed to fire poe port reset")
-
-        logging.debug("PowerSwitch with POE done.")
-        return
-
-    else:
-        logging.warning("no PowerSwitch configured. Do it manually!!!")
+            # keep the minimal interval between two operations on the same target
+            with self._lock:
+                start_time = max(time.monotonic(), self._next_start.get(target, 0))
+                self._next_start[target] = start_time + self._min_interval
+            time.sleep(max(0, start_time - time.monotonic()))
+            self._update_queue_depth(target, -1)
+
+            wait_time = time.monotonic() - wait_start
+            logging.debug("Waited {:.1f}s for power target {}".format(wait_time, target))
+            if _prometheus_enable:
+                metrics['rmd_power_target_wait_time'].labels(target).observe(wait_time)
+            yield
+        finally:
+            semaphore.release()
+
+
+class PowerCycleBatcher(object):
+    """ power cycles devices requested within a short window together: all power-offs,
+    one off/on delay on the event loop and then all power-ons """
+
+    def __init__(self, batch_window):
+        self._batch_window = batch_window
+        self._batch = None
+
+    async def power_cycle(self, DEVICE_ORIGIN_TO_REBOOT):
+        loop = asyncio.get_event_loop()
+        if self._batch is None:
+            self._batch = {'devices': [], 'done': loop.create_future()}
+            loop.call_later(self._batch_window, self._start_batch)
+        batch = self._batch
+        batch['devices'].append(DEVICE_ORIGIN_TO_REBOOT)
+        await batch['done']
+
+    def _start_batch(self):
+        batch, self._batch = self._batch, None
+        start_background_task(self._run_batch(batch))
+
+    async def _run_batch(self, batch):
+        try:
+            await self._power_cycle_devices(batch['devices'])
+        except Exception as e:
+            logging.error("Error in power cycle of devices {}: {}".format(", ".join(batch['devices']), e))
+        finally:
+            batch['done'].set_result(None)
+
+    async def _power_cycle_devices(self, devices):
+        loop = asyncio.get_event_loop()
+        splitGroups = {}
+        singleSteps = []
+        for device in devices:
+            driver = _rmd_data[device].power_switch
+
+            ## setting data for webhook
+            _rmd_data[device].reboot_forced = True
+            _rmd_data[device].reboot_type = _rmd_data[device].switch_mode
+
+            if driver is None:
+                logging.warning("no PowerSwitch configured for device {}. Do it manually!!!".format(device))
+            elif driver.supports_split:
+                splitGroups.setdefault(driver.target, {})[driver] = device
+            else:
+                singleSteps.append(device)
+
+        logging.info("Power cycle of devices {}".format(", ".join(devices)))
+        singleStepTasks = [loop.run_in_executor(_reboot_executor, power_reboot_device, device)
+                           for device in singleSteps]
+
+        # power off all devices, wait once without blocking a worker and power them on again,
+        # a failing power target must not keep the devices of the other targets off
+        offResults = await asyncio.gather(*[
+            loop.run_in_executor(_reboot_executor, power_off_group, target, list(group))
+            for target, group in splitGroups.items()], return_exceptions=True)
+        switchedOff = []
+        for (target, group), drivers in zip(splitGroups.items(), offResults):
+            if isinstance(drivers, Exception):
+                logging.error("Error switching off power target {}: {}".format(target, drivers))
+                # the devices may be switched off partly
+                drivers = list(group)
+            for driver in set(group) - set(drivers):
+                _rmd_data[group[driver]].status = 3
+            if drivers:
+                switchedOff.append((target, drivers))
+
+        if switchedOff:
+            await asyncio.sleep(powerSwitch.get_off_on_sleep())
+            onResults = await asyncio.gather(*[
+                loop.run_in_executor(_reboot_executor, power_on_group, target, drivers)
+                for target, drivers in switchedOff], return_exceptions=True)
+            for (target, drivers), result in zip(switchedOff, onResults):
+                if isinstance(result, Exception):
+                    logging.error("Error switching on power target {}: {}".format(target, result))
+
+        for device, result in zip(singleSteps, await asyncio.gather(*singleStepTasks, return_exceptions=True)):
+            if isinstance(result, Exception):
+                logging.error("Error in power cycle of device {}: {}".format(device, result))
+
+
+def power_off_group(target, drivers):
+    """ switch off the devices of one power target, returns the drivers which were switched off """
+    with _power_limiter.acquire(target):
+        return powerSwitch.power_off_batch(drivers)
+
+
+def power_on_group(target, drivers):
+    """ switch on the devices of one power target """
+    with _power_limiter.acquire(target):
+        powerSwitch.power_on_batch(drivers)
+
+
+def power_reboot_device(DEVICE_ORIGIN_TO_REBOOT):
+    """ power cycle a device whose driver does off and on in one step """
+    driver = _rmd_data[DEVICE_ORIGIN_TO_REBOOT].power_switch
+    with _power_limiter.acquire(driver.target):
+        result = driver.reboot()
+    if result == powerSwitch.REBOOT_PORT_DISABLED:
+        _rmd_data[DEVICE_ORIGIN_TO_REBOOT].status = 3
+
+
+def observe_power_switch_timing(switch_mode, operation, seconds):
+    if _prometheus_enable:
+        metrics['rmd_power_driver_duration'].labels(switch_mode, operation).observe(seconds)
 
 
 def init_rmd_info():
@@ -592,214 +1170,426 @@ def init_rmd_info():
     rmd_script_running_info = prometheus_client.Gauge('rmd_script_cycle_info', 'Actual cycle of the running script')
     rmd_script_running_info.set(0)
 
-    # Prometheus metric for device config
-    rmd_metric_device_info = prometheus_client.Gauge('rmd_metric_device_info', 'Device infos from config',
-                                                     ['device', 'device_location', 'mapper_mode', 'ip_address',
-                                                      'switch_mode'])
-    for device, data in _rmd_data.items():
-        rmd_metric_device_info.labels(device, data['device_location'], data['mapper_mode'], data['ip_address'],
-                                      data['switch_mode']).set(1)
-
-    # Prometheus metric for device
-    rmd_metric_device_last_seen = prometheus_client.Gauge('rmd_metric_device_last_seen', 'Device last seen', ['device'])
-    rmd_metric_device_status = prometheus_client.Gauge('rmd_metric_device_status', 'Device status', ['device'])
-    rmd_metric_device_last_reboot_time = prometheus_client.Gauge('rmd_metric_device_last_reboot_time',
-                                                                 'Device last reboot time', ['device'])
-    rmd_metric_device_reboot_count = prometheus_client.Gauge('rmd_metric_device_reboot_count', 'Device reboot count',
-                                                             ['device'])
-    rmd_metric_device_reboot_force = prometheus_client.Gauge('rmd_metric_device_reboot_force',
-                                                             'Device need reboot force', ['device'])
-    rmd_metric_device_last_reboot_forced_time = prometheus_client.Gauge('rmd_metric_device_last_reboot_forced_time',
-                                                                        'Device last reboot force time', ['device'])
-    rmd_metric_device_webhook_id = prometheus_client.Gauge('rmd_metric_device_webhook_id',
-                                                           'Actual status discord webhook id', ['device'])
+    # Prometheus metric for rotom api requests
+    rmd_api_fetch_duration = prometheus_client.Histogram('rmd_api_fetch_duration_seconds',
+                                                         'Duration of device status requests to the rotom api')
+    rmd_api_fetch_retries = prometheus_client.Counter('rmd_api_fetch_retries',
+                                                      'Failed device status requests to the rotom api which were retried')
+
+    # Prometheus metric for adb connects
+    rmd_adb_connect_duration = prometheus_client.Histogram('rmd_adb_connect_duration_seconds',
+                                                           'Duration until a connected device is ready via adb',
+                                                           buckets=(0.25, 0.5, 1, 2, 3, 5, 10, 20, 30))
+
+    # Prometheus metric for power targets
+    rmd_power_target_queue_depth = prometheus_client.Gauge('rmd_power_target_queue_depth',
+                                                           'Power operations waiting for a power target', ['target'])
+    rmd_power_target_wait_time = prometheus_client.Histogram('rmd_power_target_wait_time_seconds',
+                                                             'Time power operations waited for a power target',
+                                                             ['target'], buckets=(0.1, 0.5, 1, 2, 5, 10, 30, 60, 120))
+
+    # Prometheus metric for power switch drivers
+    rmd_power_driver_duration = prometheus_client.Histogram('rmd_power_driver_duration_seconds',
+                                                            'Duration of power switch driver operations',
+                                                            ['switch_mode', 'operation'],
+                                                            buckets=(0.1, 0.5, 1, 2, 5, 10, 20, 30, 60))
+
+    # Prometheus metrics for the control loop
+    rmd_loop_phase_duration = prometheus_client.Histogram('rmd_loop_phase_duration_seconds',
+                                                          'Duration of the phases of the control loop', ['phase'],
+                                                          buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60,
+                                                                   120, 300))
+    rmd_cycle_overruns = prometheus_client.Counter('rmd_cycle_overruns',
+                                                   'Check cycles which took longer than the check interval')
+    rmd_reboot_duration = prometheus_client.Histogram('rmd_reboot_duration_seconds',
+                                                      'Duration of a device reboot from start to the end of the power cycle',
+                                                      ['switch_mode', 'reboot_type'],
+                                                      buckets=(1, 2, 5, 10, 20, 30, 60, 120, 300, 600))
+
+    # Prometheus metric for adb commands
+    rmd_adb_command_duration = prometheus_client.Histogram('rmd_adb_command_duration_seconds',
+                                                           'Latency of commands to the adb server', ['command'],
+                                                           buckets=(0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10))
+
+    # Prometheus metric for discord messages
+    rmd_discord_request_duration = prometheus_client.Histogram('rmd_discord_request_duration_seconds',
+                                                               'Latency of requests to the discord webhook',
+                                                               ['method'],
+                                                               buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10))
+    rmd_discord_suppressed_updates = prometheus_client.Counter('rmd_discord_suppressed_updates',
+                                                               'Discord message updates skipped without visible change')
+
+    # Prometheus metrics for devices are rendered from the device state on scrape
+    prometheus_client.REGISTRY.register(DeviceMetricsCollector())
 
     # Return a dictionary containing the metrics
     return {
         'rmd_version_info': rmd_version_info,
         'rmd_script_running_info': rmd_script_running_info,
-        'rmd_metric_device_info': rmd_metric_device_info,
-        'rmd_metric_device_last_seen': rmd_metric_device_last_seen,
-        'rmd_metric_device_status': rmd_metric_device_status,
-        'rmd_metric_device_last_reboot_time': rmd_metric_device_last_reboot_time,
-        'rmd_metric_device_reboot_count': rmd_metric_device_reboot_count,
-        'rmd_metric_device_reboot_force': rmd_metric_device_reboot_force,
-        'rmd_metric_device_last_reboot_forced_time': rmd_metric_device_last_reboot_forced_time,
-        'rmd_metric_device_webhook_id': rmd_metric_device_webhook_id,
-    }
-
-
-def set_metric_values(device, metric, value):
-    try:
-        # Convert None, False, and True to numbers
-        if value is None:
-            value = 0
-        elif value is True:
-            value = 1
-        elif value is False:
-            value = 0
-
-        metric.labels(device).set(value)
-
-    except Exception as e:
-        logging.error(f"Error setting Prometheus metric for device {device}: {e}")
-
-
-def set_device_metrics(device, data, metrics):
-    metrics_mapping = {
-        'rmd_metric_device_last_seen': 'last_seen',
-        'rmd_metric_device_status': 'status',
-        'rmd_metric_device_last_reboot_time': 'last_reboot_time',
-        'rmd_metric_device_reboot_count': 'reboot_count',
-        'rmd_metric_device_reboot_force': 'reboot_force',
-        'rmd_metric_device_last_reboot_forced_time': 'last_reboot_forced_time',
-        'rmd_metric_device_webhook_id': 'webhook_id',
+        'rmd_api_fetch_duration': rmd_api_fetch_duration,
+        'rmd_api_fetch_retries': rmd_api_fetch_retries,
+        'rmd_adb_connect_duration': rmd_adb_connect_duration,
+        'rmd_power_target_queue_depth': rmd_power_target_queue_depth,
+        'rmd_power_target_wait_time': rmd_power_target_wait_time,
+        'rmd_power_driver_duration': rmd_power_driver_duration,
+        'rmd_loop_phase_duration': rmd_loop_phase_duration,
+        'rmd_cycle_overruns': rmd_cycle_overruns,
+        'rmd_reboot_duration': rmd_reboot_duration,
+        'rmd_adb_command_duration': rmd_adb_command_duration,
+        'rmd_discord_request_duration': rmd_discord_request_duration,
+        'rmd_discord_suppressed_updates': rmd_discord_suppressed_updates,
     }
 
-    for metric_name, data_key in metrics_mapping.items():
-        metric = metrics[metric_name]
-        value = data[data_key]
-        set_metric_values(device, metric, value)
-
-
-def create_prometheus_metrics(metrics):
-    logging.info('Creating metrics for Prometheus...')
-    metrics['rmd_script_running_info'].inc()
-    for device, data in _rmd_data.items():
-        set_device_metrics(device, data, metrics)
-
 
-def discord_message(device_origin, fixed=False):
-    if not _discord_webhook_enable:
-        return
-
-    # create data for webhook
-    logging.info('Start Webhook for device ' + device_origin)
-
-    data = {
-        "content": "",
-        "username": "Alert!",
-        "avatar_url": "https://github.com/GhostTalker/icons/blob/main/rmd/messagebox_critical_256.png?raw=true",
-        "embeds": [
-            {
-                "title": "Device restarted!",
-                "color": 16711680,
-                "author": {
-                    "name": "RebootMadDevice",
-                    "url": "https://github.com/GhostTalker/RebootMadDevice",
-                    "icon_url": "https://github.com/GhostTalker/icons/blob/main/Ghost/GhostTalker.jpg?raw=true"
-                },
-                "thumbnail": {
-                    "url": "https://github.com/GhostTalker/icons/blob/main/rmd/reboot.jpg?raw=true"
-                },
-                "fields": [
-                    {
-                        "name": "Device",
-                        "value": device_origin,
-                        "inline": "true"
-                    },
-                    {
-                        "name": "Reboot",
-                        "value": _rmd_data[device_origin]['reboot_type'],
-                        "inline": "true"
-                    },
-                    {
-                        "name": "Force",
-                        "value": _rmd_data[device_origin]['reboot_forced'],
-                        "inline": "true"
-                    }
-                ]
-            }
-        ]
+def metric_value(value):
+    # Convert None, False, and True to numbers
+    if value is None or value is False:
+        return 0
+    if value is True:
+        return 1
+    return float(value)
+
+
+class DeviceMetricsCollector(object):
+    """ prometheus collector which renders the device metrics from _rmd_data on every scrape """
+    # metric name, description and DeviceState attribute
+    DEVICE_METRICS = (
+        ('rmd_metric_device_last_seen', 'Device last seen', 'last_seen'),
+        ('rmd_metric_device_status', 'Device status', 'status'),
+        ('rmd_metric_device_last_reboot_time', 'Device last reboot time', 'last_reboot_time'),
+        ('rmd_metric_device_reboot_count', 'Device reboot count', 'reboot_count'),
+        ('rmd_metric_device_reboot_force', 'Device need reboot force', 'reboot_force'),
+        ('rmd_metric_device_last_reboot_forced_time', 'Device last reboot force time', 'last_reboot_forced_time'),
+        ('rmd_metric_device_webhook_id', 'Actual status discord webhook id', 'webhook_id'),
+    )
+
+    def describe(self):
+        # names only, the registry must not call collect() before the devices are loaded
+        yield GaugeMetricFamily('rmd_metric_device_info', 'Device infos from config',
+                                labels=['device', 'device_location', 'mapper_mode', 'ip_address', 'switch_mode'])
+        for name, description, attribute in self.DEVICE_METRICS:
+            yield GaugeMetricFamily(name, description, labels=['device'])
+
+    def collect(self):
+        # snapshot, devices can be added or removed by a reload while scraping
+        devices = list(_rmd_data.items())
+
+        device_info = GaugeMetricFamily('rmd_metric_device_info', 'Device infos from config',
+                                        labels=['device', 'device_location', 'mapper_mode', 'ip_address',
+                                                'switch_mode'])
+        for device, data in devices:
+            device_info.add_metric([device, str(data.device_location), str(data.mapper_mode), str(data.ip_address),
+                                    str(data.switch_mode)], 1)
+        yield device_info
+
+        for name, description, attribute in self.DEVICE_METRICS:
+            family = GaugeMetricFamily(name, description, labels=['device'])
+            for device, data in devices:
+                try:
+                    family.add_metric([device], metric_value(getattr(data, attribute)))
+                except (TypeError, ValueError) as e:
+                    logging.error(f"Error setting Prometheus metric for device {device}: {e}")
+            yield family
+
+
+## static parts of the discord messages
+_discord_embed_template = {
+    "title": "Device restarted!",
+    "color": 16711680,
+    "author": {
+        "name": "RebootMadDevice",
+        "url": "https://github.com/GhostTalker/RebootMadDevice",
+        "icon_url": "https://github.com/GhostTalker/icons/blob/main/Ghost/GhostTalker.jpg?raw=true"
+    },
+    "thumbnail": {
+        "url": "https://github.com/GhostTalker/icons/blob/main/rmd/reboot.jpg?raw=true"
     }
+}
+_discord_payload_template = {
+    "content": "",
+    "username": "Alert!",
+    "avatar_url": "https://github.com/GhostTalker/icons/blob/main/rmd/messagebox_critical_256.png?raw=true"
+}
+
+
+def discord_embed(device_origin, fixed=None):
+    """ visible content of the embed of a device, fixed is None for a new message and True/False for updates """
+    data = _rmd_data[device_origin]
+    description = f"`{device_origin}` did not send useful data for more than `{round(calc_past_sec_from_now(data.last_seen) / 60)}` minutes!\nReboot count: `{data.reboot_count}`"
+    if fixed is not None:
+        description += "\nFixed :white_check_mark:" if fixed else "\nFixed :x:"
+    return dict(_discord_embed_template, description=description, fields=[
+        {
+            "name": "Device",
+            "value": device_origin,
+            "inline": "true"
+        },
+        {
+            "name": "Reboot",
+            "value": data.reboot_type,
+            "inline": "true"
+        },
+        {
+            "name": "Force",
+            "value": data.reboot_forced,
+            "inline": "true"
+        }
+    ])
+
+
+def discord_payload(embeds):
     # add timestamp
-    data["embeds"][0]["timestamp"] = str(datetime.datetime.utcnow())
+    timestamp = str(datetime.datetime.utcnow())
+    return dict(_discord_payload_template, embeds=[dict(embed, timestamp=timestamp) for embed in embeds])
+
+
+class DiscordDispatcher(object):
+    """ sends discord messages from a background thread, updates of a message are coalesced, new alerts are
+    batched into one message with up to 10 embeds and discord rate limits are respected """
+
+    MAX_EMBEDS = 10
+
+    def __init__(self, batch_window, timeout):
+        self._batch_window = batch_window
+        self._timeout = timeout
+        self._session = requests.Session()
+        self._lock = Lock()
+        self._wakeup = Event()
+        self._new_devices = []
+        self._dirty_messages = set()
+        # devices and fixed devices of every sent message
+        self._messages = {}
+        # last sent embeds of every message
+        self._rendered = {}
+        self._next_request = 0
+        Thread(target=self._run, name='rmd-discord', daemon=True).start()
+
+    def _message(self, webhook_id, device_origin):
+        # messages of a previous run of RMD are only known by the webhook_id of their devices
+        message = self._messages.setdefault(webhook_id, {'devices': [], 'fixed': set()})
+        if device_origin not in message['devices']:
+            message['devices'].append(device_origin)
+        return message
+
+    def alert(self, device_origin):
+        """ new message for a rebooted device or update of its existing message """
+        if not _discord_webhook_enable:
+            return
+        with self._lock:
+            webhook_id = _rmd_data[device_origin].webhook_id
+            if webhook_id == 0:
+                if device_origin not in self._new_devices:
+                    self._new_devices.append(device_origin)
+            else:
+                self._message(webhook_id, device_origin)['fixed'].discard(device_origin)
+                self._dirty_messages.add(webhook_id)
+        self._wakeup.set()
+
+    def update(self, device_origin):
+        """ refresh the existing message of a device """
+        if not _discord_webhook_enable:
+            return
+        with self._lock:
+            webhook_id = _rmd_data[device_origin].webhook_id
+            if webhook_id == 0:
+                return
+            self._message(webhook_id, device_origin)
+            self._dirty_messages.add(webhook_id)
+        self._wakeup.set()
+
+    def fixed(self, device_origin, webhook_id):
+        """ mark the device as fixed in its message """
+        if not _discord_webhook_enable:
+            return
+        with self._lock:
+            self._message(webhook_id, device_origin)['fixed'].add(device_origin)
+            self._dirty_messages.add(webhook_id)
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            # collect more updates before sending
+            time.sleep(self._batch_window)
+            with self._lock:
+                self._wakeup.clear()
+                newDevices, self._new_devices = self._new_devices, []
+                dirtyMessages, self._dirty_messages = self._dirty_messages, set()
+            try:
+                for index in range(0, len(newDevices), self.MAX_EMBEDS):
+                    self._post(newDevices[index:index + self.MAX_EMBEDS])
+                for webhook_id in dirtyMessages:
+                    self._patch(webhook_id)
+            except Exception as e:
+                logging.error("Error sending discord messages: {}".format(e))
+
+    def _send(self, method, url, **kwargs):
+        while True:
+            # wait for the rate limit bucket to reset
+            time.sleep(max(0, self._next_request - time.monotonic()))
+            request_start = time.monotonic()
+            try:
+                response = self._session.request(method, url, timeout=self._timeout, **kwargs)
+            except requests.exceptions.RequestException as err:
+                logging.error(err)
+                return None
+            finally:
+                if _prometheus_enable:
+                    metrics['rmd_discord_request_duration'].labels(method).observe(time.monotonic() - request_start)
+
+            if response.headers.get('X-RateLimit-Remaining') == '0':
+                self._next_request = time.monotonic() + float(response.headers.get('X-RateLimit-Reset-After', 0))
+            if response.status_code == 429:
+                retry_after = float(response.headers.get('Retry-After') or response.json().get('retry_after', 1))
+                logging.warning("Discord rate limit reached, retry in {:.1f}s".format(retry_after))
+                self._next_request = time.monotonic() + retry_after
+                continue
+
+            try:
+                response.raise_for_status()
+            except requests.exceptions.RequestException as err:
+                logging.error(err)
+                return None
+            return response
+
+    def _post(self, devices):
+        devices = [device for device in devices if device in _rmd_data]
+        if not devices:
+            return
+        logging.info('Start Webhook for devices ' + ", ".join(devices))
+        embeds = [discord_embed(device) for device in devices]
+        data = discord_payload(embeds)
+        logging.debug(f'data to send with webhook:')
+        logging.debug(data)
+
+        response = self._send('POST', _discord_webhook_url, json=data, params={"wait": True})
+        if response is None:
+            return
+        answer = response.json()
+        logging.debug(answer)
+
+        with self._lock:
+            self._rendered[answer["id"]] = embeds
+            message = self._messages.setdefault(answer["id"], {'devices': devices, 'fixed': set()})
+            for device in devices:
+                if _rmd_data[device].status == 0:
+                    # device came back while the message was sent
+                    message['fixed'].add(device)
+                    self._dirty_messages.add(answer["id"])
+                    self._wakeup.set()
+                else:
+                    _rmd_data[device].webhook_id = answer["id"]
+
+    def _patch(self, webhook_id):
+        with self._lock:
+            message = self._messages.get(webhook_id)
+            if message is None:
+                return
+            devices = [device for device in message['devices'] if device in _rmd_data]
+            fixed = set(message['fixed'])
+        if not devices:
+            return
+
+        embeds = [discord_embed(device, device in fixed) for device in devices]
+        if embeds == self._rendered.get(webhook_id):
+            # nothing visible changed since the last update
+            logging.debug("Discord message {} is unchanged".format(webhook_id))
+            if _prometheus_enable:
+                metrics['rmd_discord_suppressed_updates'].inc()
+        else:
+            logging.debug("Updating discord message {} for devices {}".format(webhook_id, ", ".join(devices)))
+            if self._send('PATCH', _discord_webhook_url + "/messages/" + str(webhook_id),
+                          json=discord_payload(embeds)) is not None:
+                self._rendered[webhook_id] = embeds
+
+        # forget messages of which all devices are fixed
+        with self._lock:
+            if set(devices) <= message['fixed'] and webhook_id not in self._dirty_messages:
+                self._messages.pop(webhook_id, None)
+                self._rendered.pop(webhook_id, None)
+
+
+## startup only when run as script, the functions can be imported by the tests
+if __name__ == '__main__':
+    ## Logging handler
+    if _log_mode == "console":
+        logging.basicConfig(format='%(asctime)s %(levelname)-8s %(message)s', level=logging.getLevelName(_log_level))
+        logger = logging.getLogger(__name__)
+        stdout_handler = logging.StreamHandler(sys.stdout)
+        logger.addHandler(stdout_handler)
+    elif _log_mode == "file":
+        logging.basicConfig(filename=_log_filename, filemode='a', format='%(asctime)s %(levelname)-8s %(message)s',
+                            level=logging.getLevelName(_log_level))
+        logger = logging.getLogger(__name__)
+        file_handler = logging.handlers.TimedRotatingFileHandler(log_file, when="midnight", backupCount=3)
+        logger.addHandler(file_handler)
 
-    # send webhook
-    logging.debug(f'data to send with webhook:')
-    logging.debug(data)
+    try:
+        # power switch drivers
+        powerSwitch.configure(_config)
+
+        # init RMD data
+        _config_mtimes.update({_config_file: get_mtime(_config_file), _device_config: get_mtime(_device_config)})
+        _rmd_data = initRMDdata()
+
+        # restore reboot bookkeeping of the last run
+        if _state_db:
+            try:
+                _state_store = StateStore(os.path.join(_rootdir, _state_db))
+                _state_store.load(_rmd_data)
+            except sqlite3.Error as e:
+                logging.error("State database {} not usable, starting without saved state: {}".format(_state_db, e))
+                _state_store = None
+
+        # stop on SIGTERM like on Ctrl-C to save the state
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+        # streaming json parser for the rotom api
+        if _api_stream_parse:
+            try:
+                logging.debug("import ijson lib")
+                import ijson
+            except ImportError:
+                logging.warning("ijson lib not found, streaming parse of rotom api data is disabled")
+                _api_stream_parse = False
+
+        # Start up the server to expose the metrics (before the first adb command is measured).
+        if _prometheus_enable:
+            prometheus_client.start_http_server(_prometheus_port)
+            # init prometheus metrics
+            metrics = init_rmd_info()
 
-    if _rmd_data[device_origin]['webhook_id'] == 0:
-        logging.debug("WebhookID is 0, create new message.")
-        data["embeds"][0][
-            "description"] = f"`{device_origin}` did not send useful data for more than `{calc_past_sec_from_now(_rmd_data[device_origin]['last_seen']) * 60}` minutes!\nReboot count: `{_rmd_data[device_origin]['reboot_count']}`"
-        try:
-            result = requests.post(_discord_webhook_url, json=data, params={"wait": True})
-            result.raise_for_status()
-            answer = result.json()
-            logging.debug(answer)
-            _rmd_data[device_origin]["webhook_id"] = answer["id"]
-        except requests.exceptions.RequestException as err:
-            logging.error("")
-    else:
-        logging.debug("WebhookID exist, updating discord message for device {}".format(device_origin))
-        logging.debug('WebhookID is: ' + str(_rmd_data[device_origin]["webhook_id"]))
-        logging.debug('Parameter fixed is: ' + str(fixed))
-        if not fixed:
-            data["embeds"][0][
-                "description"] = f"`{device_origin}` did not send useful data for more than `{calc_past_sec_from_now(_rmd_data[device_origin]['last_seen']) * 60}` minutes!\nReboot count: `{_rmd_data[device_origin]['reboot_count']}`\nFixed :x:"
-        else:
-            data["embeds"][0][
-                "description"] = f"`{device_origin}` did not send useful data for more than `{calc_past_sec_from_now(_rmd_data[device_origin]['last_seen']) * 60}` minutes!\nReboot count: `{_rmd_data[device_origin]['reboot_count']}`\nFixed :white_check_mark:"
+        # make sure the adb server is running for the adb client
+        if _try_adb_first or _try_restart_mapper_first:
+            start_adb_server()
 
-        try:
-            result = requests.patch(_discord_webhook_url + "/messages/" + str(_rmd_data[device_origin]["webhook_id"]),
-                                    json=data)
-            result.raise_for_status()
-        except requests.exceptions.RequestException as err:
-            logging.error(err)
-
-    return result.status_code
-
-
-## Logging handler
-if _log_mode == "console":
-    logging.basicConfig(format='%(asctime)s %(levelname)-8s %(message)s', level=logging.getLevelName(_log_level))
-    logger = logging.getLogger(__name__)
-    stdout_handler = logging.StreamHandler(sys.stdout)
-    logger.addHandler(stdout_handler)
-elif _log_mode == "file":
-    logging.basicConfig(filename=_log_filename, filemode='a', format='%(asctime)s %(levelname)-8s %(message)s',
-                        level=logging.getLevelName(_log_level))
-    logger = logging.getLogger(__name__)
-    file_handler = logging.handlers.TimedRotatingFileHandler(log_file, when="midnight", backupCount=3)
-    logger.addHandler(file_handler)
-
-try:
-    # init RMD data
-    _rmd_data = initRMDdata()
-
-    # GPIO import libs
-    if eval(_gpio_usage):
-        logging.debug("import GPIO libs")
-        import RPi.GPIO as GPIO
-
-    # Start up the server to expose the metrics.
-    if _prometheus_enable:
-        prometheus_client.start_http_server(int(_prometheus_port))
-        # init prometheus metrics
-        metrics = init_rmd_info()
+        # persistent http session for the rotom api
+        _api_session = init_api_session()
 
-    # Loop for checking every configured interval
-    while True:
-        # Start checking devices
-        check_devices()
+        # background sender for discord messages
+        _discord_dispatcher = DiscordDispatcher(_discord_batch_window, _discord_timeout)
 
-        # Create prometheus metrics
-        if _prometheus_enable:
-            create_prometheus_metrics(metrics)
+        # persistent worker pool for parallel adb connects
+        _adb_executor = ThreadPoolExecutor(max_workers=_adb_connect_workers, thread_name_prefix='rmd-adb')
+
+        # timings of the power switch drivers
+        powerSwitch.set_timing_callback(observe_power_switch_timing)
 
-            # checking for rebooted devices
-        check_rebooted_devices()
+        # limits for power operations per power target
+        _power_limiter = PowerTargetLimiter(_power_target_concurrency, _power_target_min_interval)
 
-        # Reboot devices if nessessary
-        reboot_bad_devices()
+        # event loop, worker pool and global limit for reboot workflows
+        _event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_event_loop)
+        _reboot_executor = ThreadPoolExecutor(max_workers=_max_parallel_reboots, thread_name_prefix='rmd-reboot')
+        _reboot_semaphore = asyncio.Semaphore(_max_parallel_reboots)
+        _power_cycle_batcher = PowerCycleBatcher(_power_batch_window)
 
-        # Waiting for next check			
-        logging.info("Waiting for {} seconds...".format(_sleeptime_between_check))
-        time.sleep(int(_sleeptime_between_check))
+        # Loop for checking every configured interval
+        _event_loop.run_until_complete(rmd_main_loop())
 
-except KeyboardInterrupt:
-    logging.info("RMD will be stopped")
-    exit(0)	
+    except KeyboardInterrupt:
+        logging.info("RMD will be stopped")
+        save_state()
+        exit(0)	
 
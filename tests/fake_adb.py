@@ -0,0 +1,89 @@
+#
+# Local stand-in for the adb server speaking the adb wire protocol
+#
+import socket
+import threading
+
+
+class FakeAdbServer(object):
+    """ answers host:version, host:devices, host:connect and reboot: via host:transport """
+
+    def __init__(self, reachable=(), port=0):
+        # device serial -> state like the adb server lists it
+        self.devices = {}
+        self.reachable = set(reachable)
+        self.reboots = []
+        self.requests = []
+
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(('127.0.0.1', port))
+        self._socket.listen(8)
+        self.port = self._socket.getsockname()[1]
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def close(self):
+        self._socket.close()
+
+    def _serve(self):
+        while True:
+            try:
+                connection, _ = self._socket.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handle, args=(connection,), daemon=True).start()
+
+    @staticmethod
+    def _recv_request(connection):
+        length = b''
+        while len(length) < 4:
+            chunk = connection.recv(4 - len(length))
+            if not chunk:
+                return None
+            length += chunk
+        payload = b''
+        while len(payload) < int(length, 16):
+            payload += connection.recv(int(length, 16) - len(payload))
+        return payload.decode()
+
+    @staticmethod
+    def _string(answer):
+        answer = answer.encode()
+        return "{:04x}".format(len(answer)).encode() + answer
+
+    def _handle(self, connection):
+        with connection:
+            transport = None
+            while True:
+                request = self._recv_request(connection)
+                if request is None:
+                    return
+                self.requests.append(request)
+
+                if transport is not None and request == 'reboot:':
+                    self.reboots.append(transport)
+                    connection.sendall(b'OKAY')
+                    return
+                elif request == 'host:version':
+                    connection.sendall(b'OKAY' + self._string('0029'))
+                elif request == 'host:devices':
+                    connection.sendall(b'OKAY' + self._string(
+                        ''.join('{}\t{}\n'.format(serial, state) for serial, state in self.devices.items())))
+                elif request.startswith('host:connect:'):
+                    serial = request[len('host:connect:'):]
+                    if serial.rpartition(':')[0] in self.reachable:
+                        self.devices[serial] = 'device'
+                        answer = 'connected to {}'.format(serial)
+                    else:
+                        answer = 'failed to connect to {}'.format(serial)
+                    connection.sendall(b'OKAY' + self._string(answer))
+                elif request.startswith('host:transport:'):
+                    serial = request[len('host:transport:'):]
+                    if self.devices.get(serial) != 'device':
+                        connection.sendall(b'FAIL' + self._string("device '{}' not found".format(serial)))
+                        return
+                    transport = serial
+                    connection.sendall(b'OKAY')
+                else:
+                    connection.sendall(b'FAIL' + self._string('unknown host service'))
+                    return
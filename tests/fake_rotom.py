@@ -0,0 +1,61 @@
+#
+# Local stand-in for the rotom status api with ETag support
+#
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_status_data(device_count, now=0):
+    """ status data like rotom sends it, with the extra fields RMD does not use """
+    return {"devices": [{"origin": "ATV{:05d}".format(i),
+                         "dateLastMessageReceived": now - i * 1000,
+                         "version": "0.14.1",
+                         "isAlive": True,
+                         "workers": [{"workerId": "ATV{:05d}-{}".format(i, w), "isAllocated": True}
+                                     for w in range(4)]}
+                        for i in range(device_count)]}
+
+
+class FakeRotom(object):
+    """ serves the status data on /api/status and answers 304 if the ETag did not change """
+
+    def __init__(self, data):
+        self.etag = '"1"'
+        self.requests = []
+        self.set_data(data)
+
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.headers.get('If-None-Match') == fake.etag:
+                    status, body = 304, b''
+                else:
+                    status, body = 200, fake.body
+                fake.requests.append({'status': status, 'body_bytes': len(body),
+                                      'if_none_match': self.headers.get('If-None-Match')})
+                self.send_response(status)
+                self.send_header('ETag', fake.etag)
+                if status == 200:
+                    self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = "http://127.0.0.1:{}/api/status".format(self._server.server_address[1])
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def set_data(self, data):
+        self.body = json.dumps(data).encode()
+        self.etag = '"{}"'.format(int(self.etag.strip('"')) + 1)
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,33 @@
+#
+# Local stand-in for ssh to a switch: a fake ssh executable which runs the remote command with the local shell
+#
+import os
+import shlex
+import tempfile
+
+FAKE_SSH = """#!/bin/sh
+# log the ssh options and run the remote command (last argument) locally
+echo "$@" >> {calls}
+for command; do :; done
+exec sh -c "$command"
+"""
+
+
+class FakeSsh(object):
+    """ puts the fake ssh first in PATH, the calls are logged """
+
+    def __init__(self):
+        self.dir = tempfile.mkdtemp(prefix='rmd-fake-ssh-')
+        self._calls_file = os.path.join(self.dir, 'calls')
+        ssh_path = os.path.join(self.dir, 'ssh')
+        with open(ssh_path, 'w') as ssh_file:
+            ssh_file.write(FAKE_SSH.format(calls=shlex.quote(self._calls_file)))
+        os.chmod(ssh_path, 0o755)
+        self.path = self.dir + os.pathsep + os.environ.get('PATH', '')
+
+    @property
+    def calls(self):
+        if not os.path.exists(self._calls_file):
+            return []
+        with open(self._calls_file) as calls_file:
+            return calls_file.read().splitlines()
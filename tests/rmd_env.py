@@ -0,0 +1,54 @@
+#
+# Test environment for rebootMadDevice.py
+# The script reads config/config.ini below the working directory on import, so it is imported
+# from a temporary directory with a minimal config.
+#
+import os
+import sys
+import tempfile
+import importlib
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+TEST_CONFIG = """
+[ENVIROMENT]
+STATE_DB =
+
+[ROTOMAPI]
+API_ENDPOINT_STATUS = http://127.0.0.1:1/api/status
+
+[REBOOTOPTIONS]
+TRY_ADB_FIRST = True
+"""
+
+
+def load_rmd():
+    """ import rebootMadDevice once without starting the daemon """
+    if 'rebootMadDevice' in sys.modules:
+        return sys.modules['rebootMadDevice']
+
+    rootdir = tempfile.mkdtemp(prefix='rmd-test-')
+    os.makedirs(os.path.join(rootdir, 'config'))
+    with open(os.path.join(rootdir, 'config', 'config.ini'), 'w') as config_file:
+        config_file.write(TEST_CONFIG)
+    with open(os.path.join(rootdir, 'config', 'devices.json'), 'w') as devices_file:
+        devices_file.write('{}')
+
+    cwd = os.getcwd()
+    os.chdir(rootdir)
+    try:
+        rmd = importlib.import_module('rebootMadDevice')
+    finally:
+        os.chdir(cwd)
+    rmd._rmd_data = {}
+    return rmd
+
+
+def load_metrics():
+    """ prometheus metrics of rebootMadDevice, registered once in the default registry """
+    rmd = load_rmd()
+    if not hasattr(rmd, 'metrics'):
+        rmd.metrics = rmd.init_rmd_info()
+    return rmd.metrics
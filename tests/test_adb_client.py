@@ -0,0 +1,72 @@
+import socket
+import types
+import unittest
+from unittest import mock
+
+from rmd_env import load_rmd
+from fake_adb import FakeAdbServer
+
+rmd = load_rmd()
+
+
+class AdbClientTest(unittest.TestCase):
+    """ adb wire protocol client against a fake adb server """
+
+    def setUp(self):
+        self.adb = FakeAdbServer(reachable=['10.0.0.1'])
+        self.addCleanup(self.adb.close)
+        self.patch_settings(self.adb.port)
+
+    def patch_settings(self, port):
+        rmd_data = {'ATV01': types.SimpleNamespace(ip_address='10.0.0.1'),
+                    'ATV02': types.SimpleNamespace(ip_address='10.0.0.2')}
+        patcher = mock.patch.multiple(rmd, _adb_server_host='127.0.0.1', _adb_server_port=port, _adb_port='5555',
+                                      _adb_timeout=2, _rmd_data=rmd_data)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_list_connected_devices(self):
+        self.adb.devices.update({'10.0.0.1:5555': 'device', '10.0.0.2:5555': 'offline',
+                                 '10.0.0.3:5556': 'device', 'emulator-5554': 'device'})
+        self.assertEqual(rmd.list_adb_connected_devices(), {'10.0.0.1'})
+        self.assertEqual(self.adb.requests, ['host:devices'])
+
+    def test_connect_device(self):
+        self.assertTrue(rmd.connect_device('ATV01'))
+        self.assertFalse(rmd.connect_device('ATV02'))
+        self.assertEqual(rmd.list_adb_connected_devices(), {'10.0.0.1'})
+
+    def test_fail_answer_raises_adb_error(self):
+        with self.assertRaisesRegex(rmd.AdbError, 'unknown host service'):
+            rmd.adb_host_command('host:unknown')
+
+    def test_reboot(self):
+        rmd.connect_device('ATV01')
+        self.assertEqual(rmd.adb_reboot('ATV01'), 0)
+        self.assertEqual(self.adb.reboots, ['10.0.0.1:5555'])
+        # the adb server answers FAIL for devices which are not connected
+        self.assertEqual(rmd.adb_reboot('ATV02'), 1)
+        self.assertEqual(self.adb.reboots, ['10.0.0.1:5555'])
+
+    def test_server_is_started_again_when_refused(self):
+        with socket.socket() as free_socket:
+            free_socket.bind(('127.0.0.1', 0))
+            port = free_socket.getsockname()[1]
+        self.patch_settings(port)
+
+        restarted = []
+
+        def launch_adb_server():
+            restarted.append(FakeAdbServer(port=port))
+            self.addCleanup(restarted[-1].close)
+
+        with mock.patch.object(rmd, 'launch_adb_server', side_effect=launch_adb_server) as launch:
+            restarted_devices = rmd.list_adb_connected_devices()
+            self.assertEqual(rmd.list_adb_connected_devices(), set())
+        self.assertEqual(restarted_devices, set())
+        self.assertEqual(launch.call_count, 1)
+        self.assertEqual(restarted[0].requests, ['host:devices', 'host:devices'])
+
+
+if __name__ == '__main__':
+    unittest.main()
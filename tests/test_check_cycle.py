@@ -0,0 +1,34 @@
+import unittest
+from unittest import mock
+
+from rmd_env import load_rmd
+
+rmd = load_rmd()
+
+DEVICE_CONFIG = {"IP_ADDRESS": "10.0.0.1", "MAPPER_MODE": "ATLAS", "SWITCH_MODE": "HTML", "SWITCH_OPTION": "",
+                 "SWITCH_VALUE": "http://plug1/on;http://plug1/off"}
+
+
+class CheckDevicesTest(unittest.TestCase):
+    """ offline time of the devices in a check cycle """
+
+    def test_offline_time_is_measured_after_the_fetch(self):
+        device = rmd.DeviceState(DEVICE_CONFIG)
+        cycle = rmd.CycleContext()
+        # the fetch with its retries took ten minutes
+        cycle.now -= 600 * 1000
+        status_data = {'devices': [{'origin': 'ATV01', 'dateLastMessageReceived': rmd.makeTimestamp() - 1000}]}
+
+        with mock.patch.multiple(rmd, _rmd_data={'ATV01': device}, _proto_timeout=300,
+                                 _device_status_cache={'etag': None, 'last_modified': None, 'data': None,
+                                                       'index': None}), \
+                mock.patch.object(rmd, 'getDeviceStatusData', return_value=status_data):
+            rmd.check_devices(cycle)
+
+        self.assertGreaterEqual(device.offline_sec, 1)
+        self.assertLess(device.offline_sec, 60)
+        self.assertEqual(device.status, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+from unittest import mock
+
+from prometheus_client import REGISTRY
+
+from rmd_env import load_rmd, load_metrics
+
+rmd = load_rmd()
+load_metrics()
+
+DEVICE_CONFIG = {"IP_ADDRESS": "10.0.0.1", "MAPPER_MODE": "ATLAS", "SWITCH_MODE": "CMD", "SWITCH_OPTION": "",
+                 "SWITCH_VALUE": "true", "LOCATION": "rack1"}
+
+
+class DeviceMetricsCollectorTest(unittest.TestCase):
+    """ device metrics are rendered from _rmd_data on every scrape """
+
+    def setUp(self):
+        self.device = rmd.DeviceState(DEVICE_CONFIG)
+        self.device.last_seen = 1700000000000
+        self.device.status = 2
+        self.device.reboot_force = True
+        self.device.last_reboot_time = None
+        self.device.webhook_id = '1001'
+        patcher = mock.patch.multiple(rmd, _rmd_data={'ATV01': self.device})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def device_value(self, name, device='ATV01'):
+        return REGISTRY.get_sample_value(name, {'device': device})
+
+    def test_scrape_renders_current_values(self):
+        self.assertEqual(self.device_value('rmd_metric_device_last_seen'), 1700000000000)
+        self.assertEqual(self.device_value('rmd_metric_device_status'), 2)
+        self.assertEqual(self.device_value('rmd_metric_device_reboot_force'), 1)
+        self.assertEqual(self.device_value('rmd_metric_device_last_reboot_time'), 0)
+        self.assertEqual(self.device_value('rmd_metric_device_webhook_id'), 1001)
+        self.assertEqual(REGISTRY.get_sample_value('rmd_metric_device_info', {
+            'device': 'ATV01', 'device_location': self.device.device_location, 'mapper_mode': 'ATLAS',
+            'ip_address': '10.0.0.1', 'switch_mode': 'CMD'}), 1)
+
+        self.device.status = 0
+        self.assertEqual(self.device_value('rmd_metric_device_status'), 0)
+
+    def test_removed_device_has_no_metrics(self):
+        rmd._rmd_data['ATV02'] = rmd.DeviceState(DEVICE_CONFIG)
+        self.assertEqual(self.device_value('rmd_metric_device_status', 'ATV02'), 0)
+        del rmd._rmd_data['ATV02']
+        self.assertIsNone(self.device_value('rmd_metric_device_status', 'ATV02'))
+
+    def test_bad_value_is_skipped(self):
+        self.device.webhook_id = 'not a number'
+        with self.assertLogs(level='ERROR'):
+            self.assertIsNone(self.device_value('rmd_metric_device_webhook_id'))
+        self.assertEqual(self.device_value('rmd_metric_device_status'), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
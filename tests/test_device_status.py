@@ -0,0 +1,96 @@
+import unittest
+from unittest import mock
+
+from rmd_env import load_rmd
+from fake_rotom import FakeRotom, make_status_data
+
+rmd = load_rmd()
+
+
+class DeviceStatusCacheTest(unittest.TestCase):
+    """ conditional requests to the rotom api with ETag and the cached status data """
+
+    def setUp(self):
+        self.rotom = FakeRotom(make_status_data(100))
+        self.addCleanup(self.rotom.close)
+        session = rmd.init_api_session()
+        self.addCleanup(session.close)
+        patcher = mock.patch.multiple(rmd, _api_endpoint_status=self.rotom.url, _api_session=session,
+                                      _api_stream_parse=False,
+                                      _device_status_cache={'etag': None, 'last_modified': None, 'data': None,
+                                                            'index': None}, create=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_not_modified_returns_cached_data(self):
+        first = rmd.getDeviceStatusData()
+        rmd._device_status_cache['index'] = {'kept': True}
+        second = rmd.getDeviceStatusData()
+
+        self.assertIs(second, first)
+        self.assertEqual(len(second['devices']), 100)
+        self.assertEqual([request['status'] for request in self.rotom.requests], [200, 304])
+        self.assertIsNone(self.rotom.requests[0]['if_none_match'])
+        self.assertEqual(self.rotom.requests[1]['if_none_match'], self.rotom.etag)
+        # the 304 answer has no body and the index of the cached data is kept
+        self.assertEqual(self.rotom.requests[1]['body_bytes'], 0)
+        self.assertEqual(rmd._device_status_cache['index'], {'kept': True})
+
+    def test_changed_data_is_fetched_again(self):
+        rmd.getDeviceStatusData()
+        rmd._device_status_cache['index'] = {'stale': True}
+        self.rotom.set_data(make_status_data(3))
+        data = rmd.getDeviceStatusData()
+
+        self.assertEqual(len(data['devices']), 3)
+        self.assertEqual([request['status'] for request in self.rotom.requests], [200, 200])
+        self.assertIsNone(rmd._device_status_cache['index'])
+
+    def test_stream_parse_keeps_only_used_fields(self):
+        try:
+            import ijson
+        except ImportError:
+            self.skipTest("ijson not installed")
+        with mock.patch.multiple(rmd, _api_stream_parse=True, ijson=ijson, create=True):
+            data = rmd.getDeviceStatusData()
+            self.assertIs(rmd.getDeviceStatusData(), data)
+
+        self.assertEqual(data['devices'][1], {'origin': 'ATV00001', 'dateLastMessageReceived': -1000})
+        self.assertEqual([request['status'] for request in self.rotom.requests], [200, 304])
+
+
+class IndexDeviceStatusTest(unittest.TestCase):
+    """ origin keyed index of the device status data """
+
+    def test_newest_duplicate_wins(self):
+        devices = [{'origin': 'ATV01', 'dateLastMessageReceived': 1000},
+                   {'origin': 'ATV01', 'dateLastMessageReceived': 3000},
+                   {'origin': 'ATV01', 'dateLastMessageReceived': 2000},
+                   {'origin': 'ATV02', 'dateLastMessageReceived': None},
+                   {'origin': 'ATV02', 'dateLastMessageReceived': 500},
+                   {'origin': 'ATV03', 'dateLastMessageReceived': 500},
+                   {'origin': 'ATV03', 'dateLastMessageReceived': None},
+                   {'origin': 'ATV04'}]
+        with mock.patch.multiple(rmd, _rmd_data={}):
+            index = rmd.index_device_status({'devices': devices})
+        self.assertEqual({origin: data.get('dateLastMessageReceived') for origin, data in index.items()},
+                         {'ATV01': 3000, 'ATV02': 500, 'ATV03': 500, 'ATV04': None})
+
+    def test_entries_without_origin_are_skipped(self):
+        devices = [{'dateLastMessageReceived': 1000}, {'origin': None, 'dateLastMessageReceived': 1000},
+                   {'origin': 'ATV01', 'dateLastMessageReceived': 1000}]
+        with mock.patch.multiple(rmd, _rmd_data={}):
+            self.assertEqual(list(rmd.index_device_status({'devices': devices})), ['ATV01'])
+            self.assertEqual(rmd.index_device_status({}), {})
+
+    def test_missing_configured_device_is_logged(self):
+        with mock.patch.multiple(rmd, _rmd_data={'ATV01': None, 'ATV09': None}), \
+                self.assertLogs(level='DEBUG') as logs:
+            index = rmd.index_device_status({'devices': [{'origin': 'ATV01', 'dateLastMessageReceived': 1000}]})
+        self.assertNotIn('ATV09', index)
+        self.assertTrue(any("ATV09 is missing" in line for line in logs.output))
+        self.assertFalse(any("ATV01 is missing" in line for line in logs.output))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import time
+import unittest
+from unittest import mock
+
+from prometheus_client import REGISTRY
+
+from rmd_env import load_rmd, load_metrics
+from fake_discord import FakeDiscord
+
+rmd = load_rmd()
+metrics = load_metrics()
+
+DEVICE_CONFIG = {"IP_ADDRESS": "10.0.0.1", "MAPPER_MODE": "ATLAS", "SWITCH_MODE": "CMD", "SWITCH_OPTION": "",
+                 "SWITCH_VALUE": "true"}
+
+
+class DiscordDispatcherTest(unittest.TestCase):
+    """ discord messages are only updated if something visible changed """
+
+    def setUp(self):
+        self.discord = FakeDiscord()
+        self.addCleanup(self.discord.close)
+        self.device = rmd.DeviceState(DEVICE_CONFIG)
+        self.device.last_seen = rmd.makeTimestamp() - 10 * 60 * 1000
+        self.device.status = 2
+        patcher = mock.patch.multiple(rmd, _rmd_data={'ATV01': self.device}, _discord_webhook_enable=True,
+                                      _discord_webhook_url=self.discord.url, _prometheus_enable=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.dispatcher = rmd.DiscordDispatcher(0, 5)
+
+    def suppressed(self):
+        return metrics['rmd_discord_suppressed_updates']._value.get()
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, "discord dispatcher did not send")
+            time.sleep(0.01)
+
+    def test_unchanged_update_is_suppressed(self):
+        self.dispatcher.alert('ATV01')
+        self.wait_for(lambda: self.device.webhook_id == '1001')
+        description = self.discord.requests[0]['body']['embeds'][0]['description']
+        self.assertIn("more than `10` minutes", description)
+
+        self.dispatcher.update('ATV01')
+        self.wait_for(lambda: len(self.discord.requests) == 2)
+        suppressed = self.suppressed()
+        self.dispatcher.update('ATV01')
+        self.wait_for(lambda: self.suppressed() == suppressed + 1)
+        self.assertEqual([request['method'] for request in self.discord.requests], ['POST', 'PATCH'])
+
+        self.dispatcher.fixed('ATV01', '1001')
+        self.wait_for(lambda: len(self.discord.requests) == 3)
+        self.assertEqual(self.discord.requests[-1]['path'], '/webhook/messages/1001')
+        self.assertIn("Fixed :white_check_mark:", self.discord.requests[-1]['body']['embeds'][0]['description'])
+
+    def test_request_latency_is_observed(self):
+        def requests_observed():
+            return REGISTRY.get_sample_value('rmd_discord_request_duration_seconds_count', {'method': 'POST'}) or 0
+
+        count = requests_observed()
+        self.dispatcher.alert('ATV01')
+        self.wait_for(lambda: requests_observed() == count + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
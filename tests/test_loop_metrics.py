@@ -0,0 +1,71 @@
+import asyncio
+import time
+import types
+import unittest
+from unittest import mock
+
+from prometheus_client import REGISTRY
+
+from rmd_env import load_rmd, load_metrics
+from fake_adb import FakeAdbServer
+
+rmd = load_rmd()
+load_metrics()
+
+
+def sample(name, labels=None):
+    return REGISTRY.get_sample_value(name, labels or {}) or 0
+
+
+class LoopMetricsTest(unittest.TestCase):
+    """ duration metrics of the control loop """
+
+    def setUp(self):
+        patcher = mock.patch.multiple(rmd, _prometheus_enable=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_check_cycle_phases_are_observed(self):
+        phases = ('check_devices', 'check_rebooted_devices', 'find_bad_devices')
+        counts = [sample('rmd_loop_phase_duration_seconds_count', {'phase': phase}) for phase in phases]
+        with mock.patch.multiple(rmd, check_devices=mock.DEFAULT, check_rebooted_devices=mock.DEFAULT,
+                                 find_bad_devices=mock.Mock(return_value=[])):
+            self.assertEqual(rmd.check_cycle(rmd.CycleContext()), [])
+
+        for phase, count in zip(phases, counts):
+            self.assertEqual(sample('rmd_loop_phase_duration_seconds_count', {'phase': phase}), count + 1, phase)
+
+    def test_cycle_longer_than_interval_is_counted(self):
+        def check_cycle(cycle):
+            time.sleep(0.05)
+            return []
+
+        async def stop_loop(sleeptime):
+            raise asyncio.CancelledError()
+
+        overruns = sample('rmd_cycle_overruns_total')
+        with mock.patch.multiple(rmd, _sleeptime_between_check=0, _state_save_interval=3600,
+                                 reload_changed_config=mock.DEFAULT, check_cycle=check_cycle,
+                                 reboot_bad_devices=mock.DEFAULT), \
+                mock.patch.object(rmd.asyncio, 'sleep', stop_loop), \
+                self.assertLogs(level='WARNING') as logs:
+            with self.assertRaises(asyncio.CancelledError):
+                asyncio.run(rmd.rmd_main_loop())
+
+        self.assertIn("longer than the check interval", "\n".join(logs.output))
+        self.assertEqual(sample('rmd_cycle_overruns_total'), overruns + 1)
+
+    def test_adb_command_latency_is_observed(self):
+        adb = FakeAdbServer(reachable=['10.0.0.1'])
+        self.addCleanup(adb.close)
+        labels = {'command': 'host:devices'}
+        count = sample('rmd_adb_command_duration_seconds_count', labels)
+        with mock.patch.multiple(rmd, _adb_server_host='127.0.0.1', _adb_server_port=adb.port, _adb_timeout=2,
+                                 _rmd_data={'ATV01': types.SimpleNamespace(ip_address='10.0.0.1')}):
+            rmd.list_adb_connected_devices()
+
+        self.assertEqual(sample('rmd_adb_command_duration_seconds_count', labels), count + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,205 @@
+import configparser
+import socket
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from rmd_env import REPO_DIR  # noqa: F401 (repo on sys.path)
+
+import powerSwitch
+
+
+class FakePlug(object):
+    """ web power plug which logs the requested paths """
+
+    def __init__(self):
+        self.paths = []
+        plug = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                plug.paths.append(self.path)
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = "http://127.0.0.1:{}".format(self._server.server_address[1])
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def refused_url():
+    with socket.socket() as free_socket:
+        free_socket.bind(('127.0.0.1', 0))
+        return "http://127.0.0.1:{}".format(free_socket.getsockname()[1])
+
+
+class CreateDriverTest(unittest.TestCase):
+    """ parsing of SWITCH_MODE, SWITCH_OPTION and SWITCH_VALUE of devices.json """
+
+    def test_valid_entries(self):
+        driver = powerSwitch.create_driver('HTML', '', 'http://plug1/on;http://plug1/off')
+        self.assertIsInstance(driver, powerSwitch.HtmlDriver)
+        self.assertEqual(driver.target, 'HTML:plug1')
+        self.assertEqual(powerSwitch.create_driver('PB', '/dev/ttyUSB0', '1,2').relays, [1, 2])
+
+    def test_unknown_mode(self):
+        self.assertIsNone(powerSwitch.create_driver('UNKNOWN', '', ''))
+
+    def test_bad_entries_are_logged_and_skipped(self):
+        bad_entries = [('HTML', '', 'http://plug1/on'),
+                       ('SCRIPT', '', 'on.sh'),
+                       ('SNMP', 'pdu1', '1'),
+                       ('PB', '/dev/ttyUSB0', 'one'),
+                       ('GPIO', 'NO', 'x'),
+                       ('HTML', '', None)]
+        for entry in bad_entries:
+            with self.subTest(entry=entry), self.assertLogs(level='ERROR'):
+                self.assertIsNone(powerSwitch.create_driver(*entry))
+
+
+class PowerBatchTest(unittest.TestCase):
+    """ a failing device must not keep the other devices of a batch switched off """
+
+    def setUp(self):
+        self.plug = FakePlug()
+        self.addCleanup(self.plug.close)
+        patcher = mock.patch.dict(powerSwitch._settings, {'html_timeout': 2})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_refused_html_plug(self):
+        bad_url = refused_url()
+        drivers = [powerSwitch.create_driver('HTML', '', '{0}/on1;{0}/off1'.format(self.plug.url)),
+                   powerSwitch.create_driver('HTML', '', '{0}/on2;{0}/off2'.format(bad_url))]
+        with self.assertLogs(level='ERROR'):
+            switched_off = powerSwitch.power_off_batch(drivers)
+            powerSwitch.power_on_batch(switched_off)
+        self.assertEqual(switched_off, drivers)
+        self.assertEqual(self.plug.paths, ['/off1', '/on1'])
+
+    def test_raising_driver(self):
+        drivers = [powerSwitch.create_driver('SCRIPT', '', 'on1;off1'),
+                   powerSwitch.create_driver('SCRIPT', '', 'on2;off2')]
+        calls = []
+
+        def run(driver, script):
+            if script == 'off1':
+                raise RuntimeError("broken")
+            calls.append(script)
+
+        with mock.patch.object(powerSwitch.ScriptDriver, '_run', autospec=True, side_effect=run), \
+                self.assertLogs(level='ERROR'):
+            powerSwitch.power_on_batch(powerSwitch.power_off_batch(drivers))
+        self.assertEqual(calls, ['off2', 'on1', 'on2'])
+
+
+class SnmpBatchTest(unittest.TestCase):
+    """ all outlets of a PDU are switched with one snmpset """
+
+    def test_outlets_of_a_pdu_are_merged(self):
+        drivers = [powerSwitch.create_driver('SNMP', 'pdu1;private', '1,2'),
+                   powerSwitch.create_driver('SNMP', 'pdu2;private', '4'),
+                   powerSwitch.create_driver('SNMP', 'pdu1;private', '3')]
+        settings = {'snmp_version': '2c', 'snmp_outlet_oid': '.1.3.6', 'snmp_outlet_on': 1, 'snmp_outlet_off': 2,
+                    'snmp_timeout': 10}
+        with mock.patch.dict(powerSwitch._settings, settings), \
+                mock.patch.object(powerSwitch.subprocess, 'check_output') as check_output:
+            powerSwitch.power_off_batch(drivers)
+
+        self.assertCountEqual([call.args[0] for call in check_output.call_args_list], [
+            ['snmpset', '-v', '2c', '-c', 'private', 'pdu1',
+             '.1.3.6.1', 'i', '2', '.1.3.6.2', 'i', '2', '.1.3.6.3', 'i', '2'],
+            ['snmpset', '-v', '2c', '-c', 'private', 'pdu2', '.1.3.6.4', 'i', '2']])
+
+
+class PowerBoardBatchTest(unittest.TestCase):
+    """ all relays of a power board are switched with one write """
+
+    def setUp(self):
+        for patcher in (mock.patch.dict(powerSwitch._settings, {'pb_baudrate': 9600, 'off_on_sleep': 0}),
+                        mock.patch.object(powerSwitch, '_powerboards', {})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_relay_frames_of_a_board_are_merged(self):
+        try:
+            import serial  # noqa: F401
+        except ImportError:
+            self.skipTest("pyserial is not installed")
+        drivers = [powerSwitch.create_driver('PB', 'loop://', '1,2'),
+                   powerSwitch.create_driver('PB', 'loop://', '3')]
+        powerSwitch.power_off_batch(drivers)
+
+        port = powerSwitch._powerboards['loop://']['serial']
+        self.assertEqual(port.read(12), bytes([0xA0, 1, 0, 0xA1, 0xA0, 2, 0, 0xA2, 0xA0, 3, 0, 0xA3]))
+        powerSwitch.power_on_batch(drivers[1:])
+        self.assertEqual(port.read(4), bytes([0xA0, 3, 1, 0xA4]))
+
+    def test_missing_pyserial_is_logged(self):
+        driver = powerSwitch.create_driver('PB', 'loop://', '1')
+        with mock.patch.dict('sys.modules', {'serial': None}):
+            with self.assertLogs(level='ERROR'):
+                driver.reboot()
+            with self.assertLogs(level='ERROR'):
+                powerSwitch.power_off_batch([driver])
+
+
+class GpioTest(unittest.TestCase):
+    """ relay pins are only touched during a power cycle """
+
+    def configure(self, gpio_usage, gpio_backend):
+        config = configparser.ConfigParser()
+        config.read_dict({'GPIO': {'GPIO_USAGE': str(gpio_usage), 'GPIO_BACKEND': gpio_backend}})
+        for patcher in (mock.patch.dict(powerSwitch._settings),
+                        mock.patch.object(powerSwitch, '_gpio_controller', None)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        powerSwitch.configure(config)
+
+    def test_gpio_devices_without_gpio_usage(self):
+        self.configure(False, 'RPI')
+        driver = powerSwitch.create_driver('GPIO', 'NO', '17')
+        self.assertIsNotNone(driver)
+        with self.assertLogs(level='ERROR') as logs:
+            powerSwitch.power_off_batch([driver])
+        self.assertIn("GPIO_USAGE is not enabled", logs.output[0])
+        self.assertIsNone(powerSwitch._gpio_controller)
+
+    def test_missing_gpio_libs_are_logged(self):
+        try:
+            import RPi.GPIO  # noqa: F401
+            self.skipTest("RPi.GPIO is installed")
+        except (ImportError, RuntimeError):
+            pass
+        with self.assertLogs(level='ERROR'):
+            self.configure(True, 'RPI')
+        driver = powerSwitch.create_driver('GPIO', 'NO', '17')
+        with self.assertLogs(level='ERROR'):
+            powerSwitch.power_off_batch([driver])
+
+    def test_pins_are_set_up_with_the_on_level(self):
+        self.configure(True, 'MOCK')
+        gpio = powerSwitch.get_gpio_controller()._gpio
+        no_driver = powerSwitch.create_driver('GPIO', 'NO', '17')
+        nc_driver = powerSwitch.create_driver('GPIO', 'NC', '18')
+        self.assertEqual(gpio.pins, {})
+
+        with mock.patch.object(gpio, 'setup', wraps=gpio.setup) as setup:
+            powerSwitch.power_off_batch([no_driver, nc_driver])
+        setup.assert_has_calls([mock.call(17, gpio.OUT, initial=gpio.LOW), mock.call(18, gpio.OUT, initial=gpio.HIGH)])
+        self.assertEqual(gpio.pins, {17: gpio.HIGH, 18: gpio.LOW})
+        powerSwitch.power_on_batch([no_driver, nc_driver])
+        self.assertEqual(gpio.pins, {17: gpio.LOW, 18: gpio.HIGH})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from prometheus_client import REGISTRY
+
+from rmd_env import load_rmd, load_metrics
+
+rmd = load_rmd()
+load_metrics()
+
+CONCURRENCY = 2
+MIN_INTERVAL = 0.1
+THREADS = 6
+
+
+class PowerTargetLimiterTest(unittest.TestCase):
+    """ concurrent power operations on one power target """
+
+    def test_concurrency_and_interval_per_target(self):
+        limiter = rmd.PowerTargetLimiter(CONCURRENCY, MIN_INTERVAL)
+        lock = threading.Lock()
+        active = [0]
+        max_active = [0]
+        start_times = []
+        labels = {'target': 'HTML:plug1'}
+        waits = REGISTRY.get_sample_value('rmd_power_target_wait_time_seconds_count', labels) or 0
+
+        def power_operation():
+            with limiter.acquire('HTML:plug1'):
+                with lock:
+                    start_times.append(time.monotonic())
+                    active[0] += 1
+                    max_active[0] = max(max_active[0], active[0])
+                time.sleep(0.2)
+                with lock:
+                    active[0] -= 1
+
+        with mock.patch.multiple(rmd, _prometheus_enable=True):
+            threads = [threading.Thread(target=power_operation) for _ in range(THREADS)]
+            for thread in threads:
+                thread.start()
+            # all threads are queued before the first slot is free again
+            time.sleep(0.02)
+            self.assertGreater(REGISTRY.get_sample_value('rmd_power_target_queue_depth', labels), 0)
+            for thread in threads:
+                thread.join(10)
+
+        self.assertEqual(max_active[0], CONCURRENCY)
+        start_times.sort()
+        for previous, current in zip(start_times, start_times[1:]):
+            # small tolerance for the time between the end of the spacing sleep and the recorded start
+            self.assertGreaterEqual(current - previous, MIN_INTERVAL - 0.03)
+        self.assertEqual(REGISTRY.get_sample_value('rmd_power_target_queue_depth', labels), 0)
+        self.assertEqual(REGISTRY.get_sample_value('rmd_power_target_wait_time_seconds_count', labels),
+                         waits + THREADS)
+
+    def test_targets_are_independent(self):
+        limiter = rmd.PowerTargetLimiter(1, 10)
+        start = time.monotonic()
+        with limiter.acquire('HTML:plug1'):
+            with limiter.acquire('HTML:plug2'):
+                pass
+        self.assertLess(time.monotonic() - start, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
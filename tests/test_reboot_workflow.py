@@ -0,0 +1,113 @@
+import asyncio
+import types
+import unittest
+from unittest import mock
+
+from rmd_env import load_rmd
+
+rmd = load_rmd()
+
+
+class RebootDeviceTest(unittest.TestCase):
+    """ reboot workflow of a device which waited for a free reboot slot """
+
+    def run_reboot(self, status, status_after_adb=None):
+        device = types.SimpleNamespace(status=status, switch_mode='HTML', reboot_type=None)
+
+        def doRebootDevice(device_origin, cycle):
+            if status_after_adb is not None:
+                device.status = status_after_adb
+            return True
+
+        async def reboot():
+            batcher = mock.Mock()
+            batcher.power_cycle = mock.AsyncMock()
+            with mock.patch.multiple(rmd, _rmd_data={'ATV01': device}, _rebooting_devices={'ATV01'},
+                                     _reboot_semaphore=asyncio.Semaphore(1), _reboot_executor=None,
+                                     _power_cycle_batcher=batcher, create=True), \
+                    mock.patch.object(rmd, 'doRebootDevice', side_effect=doRebootDevice) as reboot_mock:
+                await rmd.reboot_device('ATV01', None)
+                self.assertEqual(rmd._rebooting_devices, set())
+            return reboot_mock, batcher.power_cycle
+
+        return asyncio.run(reboot())
+
+    def test_bad_device_is_power_cycled(self):
+        reboot_mock, power_cycle = self.run_reboot(status=2)
+        reboot_mock.assert_called_once()
+        power_cycle.assert_awaited_once_with('ATV01')
+
+    def test_online_device_is_skipped(self):
+        reboot_mock, power_cycle = self.run_reboot(status=0)
+        reboot_mock.assert_not_called()
+        power_cycle.assert_not_awaited()
+
+    def test_power_cycle_skipped_if_online_again(self):
+        reboot_mock, power_cycle = self.run_reboot(status=2, status_after_adb=0)
+        reboot_mock.assert_called_once()
+        power_cycle.assert_not_awaited()
+
+    def test_rebooted_device_is_still_power_cycled(self):
+        # status 1 is set by the check cycles after doRebootDevice() set last_reboot_time
+        reboot_mock, power_cycle = self.run_reboot(status=2, status_after_adb=1)
+        power_cycle.assert_awaited_once_with('ATV01')
+
+
+class BackgroundTaskTest(unittest.TestCase):
+    """ reboot tasks are referenced until they are done """
+
+    def test_reboot_task_is_kept_until_done(self):
+        async def reboot():
+            started = asyncio.Event()
+            finish = asyncio.Event()
+
+            async def reboot_devices(badDevices, cycle):
+                started.set()
+                await finish.wait()
+                rmd._rebooting_devices.difference_update(badDevices)
+
+            with mock.patch.multiple(rmd, _rebooting_devices=set(), _background_tasks=set(),
+                                     reboot_devices=reboot_devices):
+                rmd.reboot_bad_devices(['ATV01'], None)
+                await started.wait()
+                self.assertEqual(len(rmd._background_tasks), 1)
+                self.assertEqual(rmd._rebooting_devices, {'ATV01'})
+
+                finish.set()
+                await asyncio.gather(*rmd._background_tasks)
+                self.assertEqual(rmd._background_tasks, set())
+                self.assertEqual(rmd._rebooting_devices, set())
+
+        asyncio.run(reboot())
+
+
+class PowerCycleBatchTest(unittest.TestCase):
+    """ power cycle of several devices on different power targets """
+
+    def test_failing_target_does_not_keep_other_devices_off(self):
+        drivers = {device: rmd.powerSwitch.create_driver('HTML', '', 'http://{0}/on;http://{0}/off'.format(plug))
+                   for device, plug in (('ATV01', 'plug1'), ('ATV02', 'plug2'))}
+        rmd_data = {device: types.SimpleNamespace(power_switch=driver, switch_mode='HTML', status=2)
+                    for device, driver in drivers.items()}
+        switched_on = []
+
+        def power_off_group(target, group):
+            if target == 'HTML:plug2':
+                raise OSError("connection refused")
+            return group
+
+        def power_on_group(target, group):
+            switched_on.extend(group)
+
+        async def power_cycle():
+            with mock.patch.multiple(rmd, _rmd_data=rmd_data, _reboot_executor=None, create=True), \
+                    mock.patch.multiple(rmd, power_off_group=power_off_group, power_on_group=power_on_group), \
+                    mock.patch.object(rmd.powerSwitch, 'get_off_on_sleep', return_value=0), \
+                    self.assertLogs(level='ERROR'):
+                await rmd.PowerCycleBatcher(0)._power_cycle_devices(['ATV01', 'ATV02'])
+
+        asyncio.run(power_cycle())
+        self.assertCountEqual(switched_on, drivers.values())
+
+if __name__ == '__main__':
+    unittest.main()
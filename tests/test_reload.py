@@ -0,0 +1,100 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from rmd_env import load_rmd, TEST_CONFIG
+
+rmd = load_rmd()
+
+
+def device_config(ip_address, switch_value="http://plug1/on;http://plug1/off"):
+    return {"IP_ADDRESS": ip_address, "MAPPER_MODE": "ATLAS", "SWITCH_MODE": "HTML", "SWITCH_OPTION": "",
+            "SWITCH_VALUE": switch_value}
+
+
+class ReloadDevicesTest(unittest.TestCase):
+    """ reload of a changed devices.json while RMD is running """
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(prefix='rmd-reload-'), 'devices.json')
+        self.rmd_data = {'ATV01': rmd.DeviceState(device_config('10.0.0.1'))}
+        patcher = mock.patch.multiple(rmd, _device_config=self.path, _rmd_data=self.rmd_data, _config_mtimes={},
+                                      _rebooting_devices=set(), _state_store=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write_devices(self, devices):
+        with open(self.path, 'w') as devices_file:
+            json.dump(devices, devices_file)
+        # a new mtime for every write
+        rmd._config_mtimes.pop(self.path, None)
+
+    def test_devices_are_added_updated_and_removed(self):
+        old_state = self.rmd_data['ATV01']
+        self.write_devices({'ATV01': device_config('10.0.0.11'), 'ATV02': device_config('10.0.0.2')})
+        rmd.reload_changed_config()
+        self.assertIs(self.rmd_data['ATV01'], old_state)
+        self.assertEqual(self.rmd_data['ATV01'].ip_address, '10.0.0.11')
+        self.assertEqual(self.rmd_data['ATV02'].ip_address, '10.0.0.2')
+
+        self.write_devices({'ATV02': device_config('10.0.0.2')})
+        rmd.reload_changed_config()
+        self.assertEqual(list(self.rmd_data), ['ATV02'])
+
+    def test_invalid_entry_leaves_all_devices_unchanged(self):
+        bad_entry = device_config('10.0.0.3')
+        del bad_entry['SWITCH_OPTION']
+        for devices in ({'ATV01': device_config('10.0.0.11'), 'ATV03': bad_entry},
+                        {'ATV01': device_config('10.0.0.11'), 'ATV03': 'no device'},
+                        ['ATV01']):
+            with self.subTest(devices=devices):
+                self.write_devices(devices)
+                with self.assertLogs(level='ERROR'):
+                    rmd.reload_changed_config()
+                self.assertEqual(list(self.rmd_data), ['ATV01'])
+                self.assertEqual(self.rmd_data['ATV01'].ip_address, '10.0.0.1')
+
+    def test_bad_power_switch_value_does_not_stop_the_reload(self):
+        self.write_devices({'ATV01': device_config('10.0.0.1'), 'ATV02': device_config('10.0.0.2', 'http://on')})
+        with self.assertLogs(level='ERROR'):
+            rmd.reload_changed_config()
+        self.assertIsNone(self.rmd_data['ATV02'].power_switch)
+        self.assertIsNotNone(self.rmd_data['ATV01'].power_switch)
+
+
+class ReloadConfigTest(unittest.TestCase):
+    """ reload of a changed config.ini while RMD is running """
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(prefix='rmd-reload-'), 'config.ini')
+        patcher = mock.patch.multiple(rmd, _config_file=self.path, _device_config=self.path + '.missing',
+                                      _config_mtimes={}, _sleeptime_between_check=5, _api_session=mock.Mock(),
+                                      create=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # reload_config() replaces the power switch settings
+        patcher = mock.patch.dict(rmd.powerSwitch._settings)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write_config(self, sleeptime):
+        with open(self.path, 'w') as config_file:
+            config_file.write(TEST_CONFIG + "SLEEPTIME_BETWEEN_CHECK = {}\n".format(sleeptime))
+        rmd._config_mtimes.pop(self.path, None)
+
+    def test_invalid_number_keeps_the_current_settings(self):
+        self.write_config('10s')
+        with self.assertLogs(level='ERROR') as logs:
+            rmd.reload_changed_config()
+        self.assertIn("'10s'", "\n".join(logs.output))
+        self.assertEqual(rmd._sleeptime_between_check, 5)
+
+        self.write_config(10)
+        rmd.reload_changed_config()
+        self.assertEqual(rmd._sleeptime_between_check, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import subprocess
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from rmd_env import load_rmd
+
+rmd = load_rmd()
+
+
+def process_gone(pid):
+    # a killed process which is not reaped yet is a zombie
+    try:
+        with open('/proc/{}/stat'.format(pid)) as stat_file:
+            return stat_file.read().rsplit(')', 1)[1].split()[0] == 'Z'
+    except FileNotFoundError:
+        return True
+
+
+class RunSupervisedTest(unittest.TestCase):
+    """ mapper restart scripts which fail or hang """
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='rmd-supervised-')
+        self.processes = []
+        popen = subprocess.Popen
+
+        def record_popen(*args, **kwargs):
+            process = popen(*args, **kwargs)
+            self.processes.append(process)
+            return process
+
+        patcher = mock.patch.object(rmd.subprocess, 'Popen', side_effect=record_popen)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write_script(self, body):
+        path = os.path.join(self.dir, 'restart.sh')
+        with open(path, 'w') as script_file:
+            script_file.write("#!/bin/sh\n" + body)
+        os.chmod(path, 0o755)
+        return path
+
+    def test_failing_script(self):
+        script = self.write_script("echo failed\nexit 1\n")
+        self.assertEqual(rmd.run_supervised([script], 5), 1)
+        self.assertEqual(self.processes[0].returncode, 1)
+
+    def test_hanging_script_is_killed_with_its_children(self):
+        child_pid_file = os.path.join(self.dir, 'child.pid')
+        script = self.write_script("sleep 30 &\necho $! > {}\nsleep 30\n".format(child_pid_file))
+        start = time.monotonic()
+        with self.assertLogs(level='ERROR'):
+            self.assertEqual(rmd.run_supervised([script], 0.5), 1)
+
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertIsNotNone(self.processes[0].returncode)
+        with open(child_pid_file) as pid_file:
+            child_pid = int(pid_file.read())
+        deadline = time.monotonic() + 5
+        while not process_gone(child_pid):
+            self.assertLess(time.monotonic(), deadline, "child of the script is still running")
+            time.sleep(0.05)
+
+    def test_missing_script(self):
+        with self.assertLogs(level='ERROR'):
+            self.assertEqual(rmd.run_supervised([os.path.join(self.dir, 'missing.sh')], 5), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
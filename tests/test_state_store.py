@@ -0,0 +1,57 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from rmd_env import load_rmd
+
+rmd = load_rmd()
+
+DEVICE_CONFIG = {"IP_ADDRESS": "10.0.0.1", "MAPPER_MODE": "ATLAS", "SWITCH_MODE": "CMD", "SWITCH_OPTION": "",
+                 "SWITCH_VALUE": "true"}
+
+
+class StateStoreTest(unittest.TestCase):
+    """ sqlite snapshot of the reboot bookkeeping """
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(prefix='rmd-state-'), 'rmd_state.db')
+        self.store = rmd.StateStore(self.path)
+        self.addCleanup(self.store.close)
+        self.rmd_data = {device: rmd.DeviceState(DEVICE_CONFIG) for device in ('ATV01', 'ATV02', 'ATV03')}
+
+    def saved_rows(self):
+        changes = self.store._db.total_changes
+        self.store.save(self.rmd_data)
+        return self.store._db.total_changes - changes
+
+    def test_only_changed_devices_are_written(self):
+        self.assertEqual(self.saved_rows(), 3)
+        # api data of online devices changes every cycle and is not saved
+        for data in self.rmd_data.values():
+            data.last_seen = rmd.makeTimestamp()
+            data.status = 0
+        self.assertEqual(self.saved_rows(), 0)
+
+        self.rmd_data['ATV02'].reboot_count += 1
+        self.assertEqual(self.saved_rows(), 1)
+
+    def test_state_is_restored(self):
+        data = self.rmd_data['ATV01']
+        data.reboot_count = 2
+        data.reboot_forced = True
+        data.webhook_id = 1234
+        data.status = 3
+        self.store.save(self.rmd_data)
+
+        restored = {'ATV01': rmd.DeviceState(DEVICE_CONFIG)}
+        with mock.patch.object(rmd, '_state_db', self.path, create=True):
+            self.store.load(restored)
+        self.assertEqual((restored['ATV01'].reboot_count, restored['ATV01'].reboot_forced,
+                          restored['ATV01'].webhook_id), (2, True, 1234))
+        # a disabled port is not kept disabled across restarts
+        self.assertEqual(restored['ATV01'].status, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
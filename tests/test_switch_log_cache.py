@@ -0,0 +1,74 @@
+import os
+import unittest
+from unittest import mock
+
+from rmd_env import REPO_DIR  # noqa: F401 (repo on sys.path)
+from fake_ssh import FakeSsh
+
+import powerSwitch
+
+OVERLOAD_LINE = "Jan  2 10:00:05 USW-24 daemon: switch: EVT_SW_PoeOverload: Port 5 poe overload\n"
+
+
+class SwitchLogCacheTest(unittest.TestCase):
+    """ incremental reading of the switch log via a fake ssh endpoint """
+
+    def setUp(self):
+        self.ssh = FakeSsh()
+        self.log_file = os.path.join(self.ssh.dir, 'messages')
+        self.write_log("Jan  1 10:00:00 USW-24 daemon: switch: Port 5 link up\n", mode='w')
+
+        for patcher in (mock.patch.dict(os.environ, {'PATH': self.ssh.path}),
+                        mock.patch.dict(powerSwitch._settings, {'ssh_control_dir': self.ssh.dir,
+                                                                'ssh_control_persist': 600, 'ssh_timeout': 10}),
+                        mock.patch.object(powerSwitch.SwitchLogCache, 'LOG_FILE', self.log_file)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def write_log(self, text, mode='a'):
+        with open(self.log_file, mode) as log_file:
+            log_file.write(text)
+
+    def test_reads_only_new_lines(self):
+        cache = powerSwitch.SwitchLogCache(0)
+        self.assertIn("link up", cache.get_latest_port_event('admin@switch', 5)['message'])
+        self.assertIsNone(cache.get_latest_port_event('admin@switch', 6))
+
+        self.write_log("Jan  1 10:00:01 USW-24 daemon: switch: nothing about ports\n")
+        self.write_log(OVERLOAD_LINE)
+        self.assertIn("EVT_SW_PoeOverload", cache.get_latest_port_event('admin@switch', 5)['message'])
+        self.assertEqual(cache._switches['admin@switch']['offset'], os.path.getsize(self.log_file))
+
+    def test_line_still_being_written_is_read_when_complete(self):
+        cache = powerSwitch.SwitchLogCache(0)
+        cache.get_latest_port_event('admin@switch', 5)
+        complete_size = os.path.getsize(self.log_file)
+
+        self.write_log(OVERLOAD_LINE[:40])
+        self.assertIn("link up", cache.get_latest_port_event('admin@switch', 5)['message'])
+        self.assertEqual(cache._switches['admin@switch']['offset'], complete_size)
+
+        self.write_log(OVERLOAD_LINE[40:])
+        self.assertIn("EVT_SW_PoeOverload", cache.get_latest_port_event('admin@switch', 5)['message'])
+
+    def test_log_is_read_once_per_ttl_over_one_connection(self):
+        cache = powerSwitch.SwitchLogCache(60)
+        cache.get_latest_port_event('admin@switch', 5)
+        self.write_log(OVERLOAD_LINE)
+        self.assertIn("link up", cache.get_latest_port_event('admin@switch', 5)['message'])
+
+        self.assertEqual(len(self.ssh.calls), 1)
+        self.assertIn("ControlMaster=auto", self.ssh.calls[0])
+        self.assertIn("admin@switch", self.ssh.calls[0])
+
+    def test_rotated_log_is_read_from_start(self):
+        self.write_log(OVERLOAD_LINE * 3)
+        cache = powerSwitch.SwitchLogCache(0)
+        cache.get_latest_port_event('admin@switch', 5)
+        # the rotated log is smaller than the read offset
+        self.write_log(OVERLOAD_LINE.replace("Port 5", "Port 7"), mode='w')
+        self.assertIn("EVT_SW_PoeOverload", cache.get_latest_port_event('admin@switch', 7)['message'])
+
+
+if __name__ == '__main__':
+    unittest.main()